@@ -0,0 +1,184 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+from matplotlib.path import Path
+
+from cache_files import source_stamp, source_unchanged, write_atomic
+from index_ranges import expand_ranges
+from zone_raster import NO_ZONE, polygon_area
+
+ANNOTATION_PACK_MAGIC = b'AFZP'
+ANNOTATION_PACK_VERSION = 1
+# Side in image pixels of the grid cells that index zone polygons by their bounding boxes.
+PACK_GRID_CELL = 16
+# Pack entries kept in the header; every other entry is a raw array.
+PACK_HEADER_FIELDS = ('image_size', 'category_names', 'grid_cell', 'grid_shape')
+
+# Layout of a .zonepack file (all little-endian):
+#
+#     4 bytes   magic 'AFZP'
+#     uint32    header length in bytes
+#     header    UTF-8 JSON, space padded so the arrays start on an 8-byte boundary
+#     arrays    raw arrays, each starting on an 8-byte boundary
+#
+# The header holds the PACK_HEADER_FIELDS, the zone file's sha256, size and
+# mtime, and {offset, dtype, shape} for every array with offsets relative to
+# the first array. Loading is one read; the arrays are views into its bytes.
+
+
+def annotation_pack_path(annotation_path):
+    """Path of the compiled pack stored next to a COCO zone file."""
+    return f"{os.path.splitext(annotation_path)[0]}.zonepack"
+
+
+def compile_annotation_pack(coco_data, grid_cell=PACK_GRID_CELL):
+    """Flatten a COCO zone file into arrays that need no JSON parsing to use.
+
+    Holds the category id/name tables, the first polygon of every annotation
+    (the one generation uses) as one vertex array split by polygon_offsets,
+    their bounding boxes (min_x, min_y, max_x, max_y) and areas, and a grid
+    index: the annotations whose boxes overlap grid cell c are
+    cell_annotations[cell_start[c]:cell_start[c + 1]].
+    """
+    image_info = coco_data['images'][0]
+    width, height = image_info['width'], image_info['height']
+    categories = coco_data.get('categories', [])
+    annotations = coco_data['annotations']
+    polygons = [np.array(ann['segmentation'][0], dtype=np.float64).reshape(-1, 2) for ann in annotations]
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum([len(seg) for seg in polygons], out=offsets[1:])
+    vertices = np.concatenate(polygons) if polygons else np.zeros((0, 2))
+    bboxes = np.array([np.concatenate((seg.min(axis=0), seg.max(axis=0))) for seg in polygons]).reshape(-1, 4)
+
+    rows, cols = -(-height // grid_cell), -(-width // grid_cell)
+    col0, row0 = np.clip(np.floor(bboxes[:, :2] / grid_cell).astype(np.int64), 0, [cols - 1, rows - 1]).T
+    col1, row1 = np.clip(np.floor(bboxes[:, 2:] / grid_cell).astype(np.int64), 0, [cols - 1, rows - 1]).T
+    widths = col1 - col0 + 1
+    counts = widths * (row1 - row0 + 1)
+    annotation = np.repeat(np.arange(len(counts)), counts)
+    k = expand_ranges(0, counts)
+    cells = (row0[annotation] + k // widths[annotation]) * cols + col0[annotation] + k % widths[annotation]
+    cell_start = np.zeros(rows * cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=rows * cols), out=cell_start[1:])
+    return {
+        'image_size': [width, height],
+        'category_names': [cat['name'] for cat in categories],
+        'grid_cell': grid_cell,
+        'grid_shape': [rows, cols],
+        'category_ids': np.array([cat['id'] for cat in categories], dtype=np.int64),
+        'annotation_ids': np.array([ann['id'] for ann in annotations], dtype=np.int64),
+        'annotation_categories': np.array([ann['category_id'] for ann in annotations], dtype=np.int64),
+        'polygon_offsets': offsets,
+        'polygon_vertices': vertices,
+        'bboxes': bboxes,
+        'areas': np.array([polygon_area(seg) for seg in polygons], dtype=np.float64),
+        'cell_start': cell_start,
+        'cell_annotations': annotation[np.argsort(cells, kind='stable')],
+    }
+
+
+def annotation_polygon(pack, index):
+    """(N, 2) vertices of annotation index's polygon, a view into the pack."""
+    offsets = pack['polygon_offsets']
+    return pack['polygon_vertices'][offsets[index]:offsets[index + 1]]
+
+
+def save_annotation_pack(annotation_path, pack):
+    """Persist a compiled pack next to its zone file, tagged with the file's contents."""
+    header = dict(source_stamp(annotation_path), version=ANNOTATION_PACK_VERSION, arrays={})
+    header.update((name, pack[name]) for name in PACK_HEADER_FIELDS)
+    arrays = [(name, np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')))
+              for name, array in pack.items() if name not in PACK_HEADER_FIELDS]
+    offset = 0
+    for name, array in arrays:
+        header['arrays'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += -(-array.nbytes // 8) * 8
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(ANNOTATION_PACK_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for _, array in arrays:
+                f.write(array.tobytes() + b'\0' * (-array.nbytes % 8))
+
+    return write_atomic(annotation_pack_path(annotation_path), write)
+
+
+def load_annotation_pack(annotation_path):
+    """Load the compiled pack for a zone file, or None when missing, malformed or compiled from other contents.
+
+    The arrays are read-only.
+    """
+    try:
+        with open(annotation_pack_path(annotation_path), 'rb') as f:
+            data = f.read()
+        if data[:4] != ANNOTATION_PACK_MAGIC:
+            return None
+        header_length, = struct.unpack_from('<I', data, 4)
+        header = json.loads(data[8:8 + header_length])
+        if header['version'] != ANNOTATION_PACK_VERSION:
+            return None
+        if not source_unchanged(header, annotation_path):
+            return None
+        pack = {name: header[name] for name in PACK_HEADER_FIELDS}
+        start = 8 + header_length
+        for name, info in header['arrays'].items():
+            count = int(np.prod(info['shape']))
+            pack[name] = np.frombuffer(data, dtype=info['dtype'], count=count,
+                                       offset=start + info['offset']).reshape(info['shape'])
+        return pack
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+
+def get_annotation_pack(annotation_path):
+    """Load a zone file's pack, compiling and saving it first when missing or stale."""
+    pack = load_annotation_pack(annotation_path)
+    if pack is not None:
+        return pack
+    with open(annotation_path, 'r') as f:
+        pack = compile_annotation_pack(json.load(f))
+    try:
+        save_annotation_pack(annotation_path, pack)
+    except OSError as e:
+        print(f"⚠ Warning: Could not save annotation pack for '{annotation_path}': {e}", file=sys.stderr)
+    return pack
+
+
+def zones_at(pack, x, y):
+    """Category id of the zone under each image point (x, y), NO_ZONE where there is none.
+
+    Only the polygons indexed in a point's grid cell are tested. Where zones
+    overlap the smallest polygon wins, as in compile_label_raster's default.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    zones = np.full(len(x), NO_ZONE, dtype=np.int64)
+    rows, cols = pack['grid_shape']
+    with np.errstate(invalid='ignore'):
+        col = np.floor(x / pack['grid_cell'])
+        row = np.floor(y / pack['grid_cell'])
+    points = np.flatnonzero((col >= 0) & (col < cols) & (row >= 0) & (row < rows))
+    cells = row[points].astype(np.int64) * cols + col[points].astype(np.int64)
+    first = pack['cell_start'][cells]
+    counts = pack['cell_start'][cells + 1] - first
+    point = np.repeat(points, counts)
+    annotation = pack['cell_annotations'][expand_ranges(first, counts)]
+    boxes = pack['bboxes'][annotation]
+    inside = ((x[point] >= boxes[:, 0]) & (x[point] <= boxes[:, 2]) &
+              (y[point] >= boxes[:, 1]) & (y[point] <= boxes[:, 3]))
+    for index in np.unique(annotation[inside]).tolist():
+        pairs = np.flatnonzero(inside & (annotation == index))
+        inside[pairs] = Path(annotation_polygon(pack, index)).contains_points(
+            np.column_stack((x[point[pairs]], y[point[pairs]])))
+    point, annotation = point[inside], annotation[inside]
+    # Smallest polygon first per point, then keep each point's first pair
+    order = np.lexsort((pack['areas'][annotation], point))
+    point, annotation = point[order], annotation[order]
+    first_pair = np.ones(len(point), dtype=bool)
+    first_pair[1:] = point[1:] != point[:-1]
+    zones[point[first_pair]] = pack['annotation_categories'][annotation[first_pair]]
+    return zones
@@ -1,40 +1,193 @@
 import sys
 import os
-import subprocess
 import time
 import json
-from flask import Flask, render_template, request, jsonify, send_from_directory, url_for
+import math
+import random
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, url_for
+from werkzeug.security import safe_join
+import slipper_engine
+from annotation_pack import get_annotation_pack
+from jobs import FINISHED_STATES, JobManager, QueueFullError
+from mesh_lod import LOD_MODES
+from profiling import MetricsRegistry
+from result_cache import ResultCache, result_cache_key
+from sole_sizes import parse_uk_size
+from web_mesh import PRECOMPRESSED_VARIANTS, WEB_MESH_FORMAT, select_variant
 
 # --- Configuration ---
-PYTHON_EXECUTABLE = sys.executable
-SCRIPT_TO_RUN = "generate_slippers.py"
 LEFT_FOOT_STL = "Shoe_Sole_UK_8_Left.stl"
 RIGHT_FOOT_STL = "Shoe_Sole_UK_8_Right.stl"
 LEFT_ZONE_CONFIG_FILE = "Left_reflexology_zones.json"
 RIGHT_ZONE_CONFIG_FILE = "Right_reflexology_zones.json"
-GENERATED_STL_BASE_FILENAME = "sole_with_spikes"
 STL_SERVE_DIRECTORY_NAME = "."
+RESULT_CACHE_DIRECTORY_NAME = "generated_cache"
+PROFILE_DIRECTORY_NAME = "profiles"
+ZONE_BLOCKS_DIRECTORY_NAME = "zone_blocks"
+RESULT_CACHE_MAX_MB = float(os.environ.get("ACCUFOOT_RESULT_CACHE_MB", "512"))
+ENGINE_WORKERS = int(os.environ.get("ACCUFOOT_ENGINE_WORKERS", "2"))
+MAX_CONCURRENT_JOBS = int(os.environ.get("ACCUFOOT_MAX_CONCURRENT_JOBS", str(ENGINE_WORKERS)))
+MAX_PENDING_JOBS = int(os.environ.get("ACCUFOOT_MAX_PENDING_JOBS", "100"))
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+PROFILE_SAMPLE_RATE = float(os.environ.get("ACCUFOOT_PROFILE_SAMPLE_RATE", "0"))  # fraction of jobs run under cProfile
+GENERATED_FORMATS = ('ply', 'stl', WEB_MESH_FORMAT)
+GENERATED_MAX_AGE_SECONDS = 365 * 24 * 3600  # cached results are content-addressed, so never change
+DEFAULT_LOD = "print"  # for clients that send no lod; the page's form asks for a preview first
+MAX_ZONE_QUERY_POINTS = 10000  # points per /zone_at request
 
 # --- Flask App Setup ---
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 STL_SERVE_DIRECTORY = os.path.join(APP_ROOT, STL_SERVE_DIRECTORY_NAME)
+RESULT_CACHE = ResultCache(os.path.join(STL_SERVE_DIRECTORY, RESULT_CACHE_DIRECTORY_NAME),
+                           int(RESULT_CACHE_MAX_MB * 1024 * 1024))
 
-# --- Helper function to load zone keys from JSON ---
+# --- Generation Engine Worker Pool ---
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+_engine_context = multiprocessing.get_context('spawn')
+_progress_queue = None
+JOBS = JobManager(MAX_CONCURRENT_JOBS, max_pending=MAX_PENDING_JOBS)
+METRICS = MetricsRegistry()
+
+def engine_params(foot):
+    zone_config = LEFT_ZONE_CONFIG_FILE if foot == 'left' else RIGHT_ZONE_CONFIG_FILE
+    input_stl = LEFT_FOOT_STL if foot == 'left' else RIGHT_FOOT_STL
+    return {
+        'input': os.path.join(APP_ROOT, input_stl),
+        'annotations': os.path.join(APP_ROOT, zone_config),
+        'metrics': 'off',
+        'zone_blocks_dir': os.path.join(APP_ROOT, ZONE_BLOCKS_DIRECTORY_NAME),
+    }
+
+def forward_job_progress(progress_queue):
+    while True:
+        job_id, progress = progress_queue.get()
+        JOBS.update_progress(job_id, **progress)
+
+def get_engine_pool():
+    """Return the pool of long-lived generation workers, starting it on first use."""
+    global _engine_pool, _progress_queue
+    with _engine_pool_lock:
+        if _progress_queue is None:
+            _progress_queue = _engine_context.Queue()
+            threading.Thread(target=forward_job_progress, args=(_progress_queue,), daemon=True).start()
+        if _engine_pool is None:
+            # Workers are spawned rather than forked so they never inherit server threads.
+            _engine_pool = ProcessPoolExecutor(
+                max_workers=ENGINE_WORKERS,
+                mp_context=_engine_context,
+                initializer=slipper_engine.init_worker,
+                initargs=([(foot, dict(engine_params(foot), lod=lod)) for foot in slipper_engine.FEET for lod in LOD_MODES],
+                          _progress_queue))
+        return _engine_pool
+
+def reset_engine_pool(broken_pool=None):
+    """Shut down the engine pool; with broken_pool, only if that pool is still the current one."""
+    global _engine_pool
+    with _engine_pool_lock:
+        if broken_pool is not None and _engine_pool is not broken_pool:
+            return  # another job already replaced it
+        if _engine_pool is not None:
+            _engine_pool.shutdown(wait=False, cancel_futures=True)
+        _engine_pool = None
+
+def generation_output(cache_key, lod):
+    output_filename = f"{RESULT_CACHE_DIRECTORY_NAME}/{RESULT_CACHE.ply_name(cache_key)}"
+    mesh_filename = f"{RESULT_CACHE_DIRECTORY_NAME}/{RESULT_CACHE.file_name(cache_key, WEB_MESH_FORMAT)}"
+    return {
+        "lod": lod,
+        "filename": output_filename,
+        "stl_url": url_for('get_stl', filename=output_filename, _external=True),
+        "mesh_url": url_for('get_mesh', filename=mesh_filename, _external=True)
+    }
+
+def run_generation_job(job_id, target_foot, zones, params, cache_key, output):
+    """Job body: generate in a warm engine worker, then move the result into the cache.
+
+    Temporary outputs that did not make it into the cache are removed however the job ends.
+    """
+    try:
+        return generate_into_cache(job_id, target_foot, zones, params, cache_key, output)
+    finally:
+        RESULT_CACHE.discard_temp_outputs(cache_key, job_id)
+
+def generate_into_cache(job_id, target_foot, zones, params, cache_key, output):
+    output_path = RESULT_CACHE.temp_output_path(cache_key, job_id)
+    cprofile_path = None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        cprofile_path = os.path.join(APP_ROOT, PROFILE_DIRECTORY_NAME, f"{job_id}.prof")
+    print(f"DEBUG: Job {job_id}: dispatching generation: foot={target_foot}, zones={zones}", file=sys.stderr)
+    start_time = time.time()
+    pool = get_engine_pool()
+    try:
+        summary = pool.submit(
+            slipper_engine.run_job, target_foot, zones, params, output_path, job_id, GENERATED_FORMATS,
+            cprofile_path).result()
+    except BrokenProcessPool as e:
+        print(f"DEBUG: Engine worker pool failed: {e}", file=sys.stderr)
+        METRICS.inc("accufoot_jobs_total", help_text="Generation jobs run, by outcome.", outcome="crashed")
+        reset_engine_pool(pool)
+        raise RuntimeError("Server error: generation worker crashed. Please retry.") from e
+    except slipper_engine.GenerationError as e:
+        print(f"DEBUG: Job {job_id}: generation error: {e}", file=sys.stderr)
+        METRICS.inc("accufoot_jobs_total", help_text="Generation jobs run, by outcome.", outcome="failed")
+        raise RuntimeError(f"Error during generation: {str(e)[:500]}") from e
+    except Exception:
+        METRICS.inc("accufoot_jobs_total", help_text="Generation jobs run, by outcome.", outcome="failed")
+        raise
+    METRICS.add_record(summary['profile'])
+    METRICS.observe("accufoot_job_seconds", time.time() - start_time,
+                    "Job time from dispatch to the engine worker until its result returns.")
+    METRICS.inc("accufoot_jobs_total", help_text="Generation jobs run, by outcome.", outcome="done")
+    if cprofile_path:
+        print(f"DEBUG: Job {job_id}: cProfile stats saved to {cprofile_path}", file=sys.stderr)
+    for warning in summary['warnings']:
+        print(f"DEBUG: Job {job_id}: engine warning: {warning}", file=sys.stderr)
+    print(f"DEBUG: Job {job_id}: generated {summary['bump_count']} bumps in {summary['elapsed']:.2f}s", file=sys.stderr)
+
+    if not os.path.exists(summary['output']):
+        print(f"DEBUG: Job {job_id}: output file not found: {summary['output']}", file=sys.stderr)
+        raise RuntimeError("Generation finished but output PLY file was not created.")
+    RESULT_CACHE.put(cache_key, summary['outputs'])
+    return dict(output, cached=False, bump_count=summary['bump_count'], zone_bumps=summary['zone_bumps'])
+
+def job_urls(job_id):
+    return {
+        "status_url": url_for('job_status', job_id=job_id, _external=True),
+        "events_url": url_for('job_events', job_id=job_id, _external=True)
+    }
+
+def is_coordinate(value):
+    """True for a finite JSON number; bools and nulls are not coordinates."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:  # integers beyond the float range
+        return False
+
+def is_point(value):
+    return isinstance(value, list) and len(value) == 3 and all(is_coordinate(coord) for coord in value)
+
+# --- Helper function to load zone keys from the compiled zone pack ---
 def load_valid_zone_keys(config_path):
     full_config_path = os.path.join(APP_ROOT, config_path)
     if not os.path.exists(full_config_path):
         print(f"Error: Zone configuration file not found at '{full_config_path}'", file=sys.stderr)
         return None
     try:
-        with open(full_config_path, 'r') as f:
-            config_data = json.load(f)
-            if "categories" in config_data:
-                return {cat["name"].upper() for cat in config_data["categories"] if "name" in cat and cat["name"].upper() not in ['LEFT_FOOT_ORGANS', 'RIGHT_FOOT_ORGANS']}
-            else:
-                print("Warning: No 'categories' field found in zone config.", file=sys.stderr)
-                return set()
+        names = get_annotation_pack(full_config_path)['category_names']
+        if names:
+            return {name.upper() for name in names if name.upper() not in ['LEFT_FOOT_ORGANS', 'RIGHT_FOOT_ORGANS']}
+        else:
+            print("Warning: No categories found in zone config.", file=sys.stderr)
+            return set()
     except Exception as e:
         print(f"Error loading zone keys from '{full_config_path}': {e}", file=sys.stderr)
         return None
@@ -60,6 +213,7 @@ def generate_slippers():
         selected_html_values = request.form.getlist('areas')
         selected_foot = request.form.get('foot')
         selected_size = request.form.get('size')
+        selected_lod = request.form.get('lod') or DEFAULT_LOD
 
         # Validate inputs
         if not selected_html_values:
@@ -71,6 +225,14 @@ def generate_slippers():
         if not selected_size:
             print("DEBUG: No foot size selected.", file=sys.stderr)
             return jsonify({"status": "error", "message": "Please select a foot size."}), 400
+        try:
+            uk_size = parse_uk_size(selected_size)
+        except ValueError as e:
+            print(f"DEBUG: Invalid foot size: {selected_size}", file=sys.stderr)
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if selected_lod not in LOD_MODES:
+            print(f"DEBUG: Invalid level of detail: {selected_lod}", file=sys.stderr)
+            return jsonify({"status": "error", "message": "Please select either Preview or Print quality."}), 400
 
         # Process reflexology zones
         zones_to_process_internal_keys = []
@@ -94,7 +256,7 @@ def generate_slippers():
             print(f"DEBUG: Zone mapping failed: {error_message}", file=sys.stderr)
             return jsonify({"status": "error", "message": error_message}), 400
 
-        # Determine input STL based on foot (ignoring size for now)
+        # Determine input STL based on foot; other sizes are derived from it unless they have their own STL
         target_foot = selected_foot.lower()
         input_stl = LEFT_FOOT_STL if target_foot == 'left' else RIGHT_FOOT_STL
         input_stl_path = os.path.join(APP_ROOT, input_stl)
@@ -102,51 +264,67 @@ def generate_slippers():
             print(f"DEBUG: Input STL file not found: {input_stl_path}", file=sys.stderr)
             return jsonify({"status": "error", "message": f"Input STL file for {target_foot} foot (UK size 8) not found."}), 404
 
-        expected_output_filename = f"{GENERATED_STL_BASE_FILENAME}_{target_foot}.ply"  # Changed to .ply
-        expected_output_path = os.path.join(STL_SERVE_DIRECTORY, expected_output_filename)
-
-        # Run the generation script
-        command = [
-            PYTHON_EXECUTABLE,
-            SCRIPT_TO_RUN,
-            '--foot', target_foot,
-            '--input', input_stl,
-            '--output', expected_output_filename
-        ] + zones_to_process_internal_keys
-        print(f"DEBUG: Running command: {' '.join(command)}", file=sys.stderr)
+        params = dict(engine_params(target_foot), size=uk_size, lod=selected_lod)
+        resolved_params = slipper_engine.resolve_params(target_foot, params)
+        cache_key = result_cache_key(
+            target_foot, resolved_params['size'], zones_to_process_internal_keys,
+            {key: resolved_params[key] for key in slipper_engine.RESULT_PARAMS},
+            resolved_params['input'], resolved_params['annotations'])
+        output = generation_output(cache_key, selected_lod)
+        message = f"Generation successful for {target_foot} foot. Processed zones: {', '.join(zones_to_process_internal_keys)}"
+        if selected_lod == 'preview':
+            message += ". This is a preview; generate again with Print quality for the full-resolution mesh."
+        if RESULT_CACHE.get(cache_key) is not None:
+            print(f"DEBUG: Result cache hit: {output['stl_url']}", file=sys.stderr)
+            job = JOBS.add_finished(dict(output, cached=True), foot=target_foot, zones=zones_to_process_internal_keys)
+            return jsonify(dict(output, status="success", message=message, cached=True, job_id=job['id'], **job_urls(job['id'])))
 
+        # Queue generation; identical requests already in flight share one job
+        zones = list(zones_to_process_internal_keys)
         try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', cwd=APP_ROOT)
-            print(f"DEBUG: Script stdout: {result.stdout}", file=sys.stderr)
-            print(f"DEBUG: Script stderr: {result.stderr}", file=sys.stderr)
-
-            if not os.path.exists(expected_output_path):
-                print(f"DEBUG: Output file not found: {expected_output_path}", file=sys.stderr)
-                return jsonify({"status": "error", "message": "Script ran but output PLY file was not created."}), 500
-
-            stl_url = url_for('get_stl', filename=expected_output_filename, _external=True)
-            print(f"DEBUG: PLY URL generated: {stl_url}", file=sys.stderr)
-            return jsonify({
-                "status": "success",
-                "message": f"Generation successful for {target_foot} foot. Processed zones: {', '.join(zones_to_process_internal_keys)}",
-                "filename": expected_output_filename,
-                "stl_url": stl_url
-            })
-        except FileNotFoundError as e:
-            print(f"DEBUG: FileNotFoundError: {e}", file=sys.stderr)
-            return jsonify({"status": "error", "message": f"Server error: Could not find script or Python executable: {str(e)}"}), 500
-        except subprocess.CalledProcessError as e:
-            print(f"DEBUG: Subprocess error. Exit code: {e.returncode}", file=sys.stderr)
-            print(f"DEBUG: Script stdout: {e.stdout}", file=sys.stderr)
-            print(f"DEBUG: Script stderr: {e.stderr}", file=sys.stderr)
-            error_details = (e.stderr or e.stdout or "Unknown script error")[:500]
-            return jsonify({"status": "error", "message": f"Error during generation: {error_details}"}), 500
-        except Exception as e:
-            print(f"DEBUG: Unexpected error: {e}", file=sys.stderr)
-            return jsonify({"status": "error", "message": f"An unexpected server error occurred: {str(e)}"}), 500
+            job = JOBS.submit(
+                lambda job_id: run_generation_job(job_id, target_foot, zones, params, cache_key, output),
+                dedupe_key=cache_key, foot=target_foot, zones=zones)
+        except QueueFullError as e:
+            print(f"DEBUG: Job queue full: {e}", file=sys.stderr)
+            return jsonify({"status": "error", "message": "Server is busy. Please retry shortly."}), 503
+        print(f"DEBUG: Queued job {job['id']}", file=sys.stderr)
+        return jsonify(dict(status="queued", message=f"Generation queued for {target_foot} foot.",
+                            job_id=job['id'], **job_urls(job['id']))), 202
     print("DEBUG: Invalid request method.", file=sys.stderr)
     return jsonify({"status": "error", "message": "Method not allowed."}), 405
 
+@app.route('/zone_at', methods=['POST'])
+def zone_at():
+    """Batched hover lookup: map 3D sole points to the names of the zones under them.
+
+    Served in-process from the zone pack and the sole's bounds, so lookups never queue behind generation jobs.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object."}), 400
+    foot = data.get('foot')
+    points = data.get('points')
+    if foot not in ['left', 'right']:
+        return jsonify({"status": "error", "message": "Please select either Left Foot or Right Foot."}), 400
+    if not isinstance(points, list) or not all(is_point(point) for point in points):
+        return jsonify({"status": "error", "message": "Points must be a list of [x, y, z] coordinates."}), 400
+    if len(points) > MAX_ZONE_QUERY_POINTS:
+        return jsonify({"status": "error", "message": f"At most {MAX_ZONE_QUERY_POINTS} points per request."}), 400
+    try:
+        uk_size = parse_uk_size(data['size']) if data.get('size') is not None else None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    params = dict(engine_params(foot), size=uk_size)
+    try:
+        names = slipper_engine.zone_names_at(foot, points, params)
+    except (ValueError, TypeError):
+        return jsonify({"status": "error", "message": "Points must be a list of [x, y, z] coordinates."}), 400
+    except slipper_engine.GenerationError as e:
+        print(f"DEBUG: Zone lookup failed: {e}", file=sys.stderr)
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify({"status": "success", "zones": [name.upper() if name else None for name in names]})
+
 @app.route('/get_stl/<path:filename>')
 def get_stl(filename):
     print(f"DEBUG: Attempting to serve: {filename} from {STL_SERVE_DIRECTORY}", file=sys.stderr)
@@ -156,6 +334,72 @@ def get_stl(filename):
         print(f"DEBUG: File not found error for {filename}", file=sys.stderr)
         return jsonify({"status": "error", "message": "File not found"}), 404
 
+@app.route('/get_mesh/<path:filename>')
+def get_mesh(filename):
+    """Serve a compact .wmesh viewer mesh, precompressed for the client when possible."""
+    if not filename.endswith(f".{WEB_MESH_FORMAT}"):
+        return jsonify({"status": "error", "message": "File not found"}), 404
+    path = safe_join(STL_SERVE_DIRECTORY, filename)
+    if path is None or not os.path.isfile(path):
+        print(f"DEBUG: Web mesh not found: {filename}", file=sys.stderr)
+        return jsonify({"status": "error", "message": "File not found"}), 404
+    accepted = [encoding for encoding, _ in PRECOMPRESSED_VARIANTS if request.accept_encodings[encoding]]
+    path, content_encoding = select_variant(path, accepted)
+    immutable = filename.startswith(f"{RESULT_CACHE_DIRECTORY_NAME}/")
+    response = send_file(path, mimetype='application/octet-stream', download_name=os.path.basename(filename),
+                         conditional=True, etag=True,
+                         max_age=GENERATED_MAX_AGE_SECONDS if immutable else 0)
+    if content_encoding is not None:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={GENERATED_MAX_AGE_SECONDS}, immutable"
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events stream of a job's state until it finishes."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+
+    def stream(job):
+        while job is not None:
+            yield f"data: {json.dumps(job)}\n\n"
+            if job['status'] in FINISHED_STATES:
+                return
+            version = job['version']
+            job = JOBS.wait_for_change(job_id, version, JOB_EVENTS_KEEPALIVE_SECONDS)
+            while job is not None and job['version'] == version:
+                yield ": keep-alive\n\n"
+                job = JOBS.wait_for_change(job_id, version, JOB_EVENTS_KEEPALIVE_SECONDS)
+
+    return Response(stream(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(RESULT_CACHE.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: stage latency histograms, generation counters and queue/cache gauges."""
+    for status, count in JOBS.counts().items():
+        METRICS.set_gauge("accufoot_jobs", count, "Jobs currently tracked, by status.", status=status)
+    cache = RESULT_CACHE.stats()
+    for field in ('hits', 'misses'):
+        METRICS.set_counter(f"accufoot_result_cache_{field}_total", cache[field], f"Result cache {field}.")
+    for field in ('entries', 'bytes'):
+        METRICS.set_gauge(f"accufoot_result_cache_{field}", cache[field], f"Result cache {field}.")
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/get_available_zones')
 def get_available_zones():
     print("DEBUG: Serving available zones.", file=sys.stderr)
@@ -170,4 +414,8 @@ if __name__ == '__main__':
     else:
         print(f"Flask app starting. Loaded {len(VALID_INTERNAL_ZONE_KEYS_LEFT)} valid zone keys for left foot.", file=sys.stderr)
         print(f"Flask app starting. Loaded {len(VALID_INTERNAL_ZONE_KEYS_RIGHT)} valid zone keys for right foot.", file=sys.stderr)
+        # Start the engine workers up front so the first request does not pay their warm-up.
+        # Under the debug reloader only the serving child process needs them.
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            get_engine_pool().submit(os.getpid)
         app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mesh_writer import EXPORT_FORMATS
+from metrics import METRICS_MODES
+from slipper_engine import DEFAULT_PARAMS, FEET, GenerationError, resolve_params, run_job, warm_up
+
+JOB_FIELDS = ('name', 'foot', 'zones', 'output', 'formats')
+
+
+def _convert_param(key, value):
+    """Convert a manifest value to the type of the parameter's default.
+
+    Integer parameters accept any integral number, so CSV cells like 20.0 work.
+    """
+    default = DEFAULT_PARAMS[key]
+    if isinstance(default, (int, float)):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parameter '{key}' must be a number, got '{value}'.")
+        if isinstance(default, float):
+            return number
+        if not number.is_integer():
+            raise ValueError(f"Parameter '{key}' must be a whole number, got '{value}'.")
+        return int(number)
+    return value
+
+
+def _split_list(value):
+    if isinstance(value, str):
+        return [item for item in value.replace(';', ' ').replace(',', ' ').split() if item]
+    return list(value or [])
+
+
+def normalize_job(entry, index, defaults, output_dir):
+    """Turn one manifest entry into {'name', 'foot', 'zones', 'output', 'formats', 'params'}.
+
+    Keys of DEFAULT_PARAMS (at the top level or under 'params') override the
+    manifest defaults for this job; empty CSV cells are ignored.
+    """
+    merged = dict(defaults)
+    merged.update({key: value for key, value in entry.items() if value not in (None, '')})
+    unknown = set(merged) - set(JOB_FIELDS) - set(DEFAULT_PARAMS) - {'params'}
+    if unknown:
+        raise ValueError(f"Job {index}: unknown field(s) {', '.join(sorted(unknown))}.")
+    foot = str(merged.get('foot', '')).lower()
+    if foot not in FEET:
+        raise ValueError(f"Job {index}: foot must be one of {', '.join(FEET)}.")
+    params = {key: _convert_param(key, merged[key]) for key in DEFAULT_PARAMS if key in merged}
+    params.update(merged.get('params') or {})
+    name = str(merged.get('name') or f"{index:04d}_{foot}")
+    return {
+        'name': name,
+        'foot': foot,
+        'zones': [zone.upper() for zone in _split_list(merged.get('zones'))],
+        'output': merged.get('output') or os.path.join(output_dir, f"{name}.ply"),
+        'formats': _split_list(merged.get('formats')) or list(EXPORT_FORMATS),
+        'params': params,
+    }
+
+
+def load_manifest(path, output_dir):
+    """Read a JSON or CSV job manifest and return the normalized jobs.
+
+    JSON is either a list of jobs or {"defaults": {...}, "jobs": [...]}. CSV
+    has one job per row with a header naming the fields; zones are separated
+    by spaces or semicolons.
+    """
+    with open(path, 'r', newline='') as f:
+        if path.lower().endswith('.csv'):
+            defaults, entries = {}, list(csv.DictReader(f))
+        else:
+            data = json.load(f)
+            if isinstance(data, list):
+                defaults, entries = {}, data
+            else:
+                defaults, entries = data.get('defaults', {}), data.get('jobs', [])
+    return [normalize_job(entry, index, defaults, output_dir) for index, entry in enumerate(entries)]
+
+
+def preload_assets(jobs):
+    """Load every distinct sole, annotation file and acceleration structure the jobs use."""
+    seen = set()
+    for job in jobs:
+        try:
+            params = resolve_params(job['foot'], job['params'])
+        except GenerationError:
+            continue  # run_batch_job records the invalid parameters as this job's error
+        key = json.dumps([job['foot'], params], sort_keys=True, default=str)
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            warm_up(job['foot'], params)
+        except GenerationError as e:
+            print(f"⚠ Warning: Could not preload assets for {job['name']}: {e}", file=sys.stderr)
+
+
+def run_batch_job(job):
+    """Worker body: run one job and return its summary record; failures are recorded, not raised."""
+    start_time = time.time()
+    record = {'name': job['name'], 'foot': job['foot'], 'zones': job['zones'], 'worker_pid': os.getpid()}
+    try:
+        output_dir = os.path.dirname(job['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        summary = run_job(job['foot'], job['zones'], job['params'], job['output'], formats=job['formats'])
+    except Exception as e:  # one bad job must not stop an overnight batch
+        record.update(status='error', error=str(e), elapsed=time.time() - start_time)
+        return record
+    record.update(
+        status='ok',
+        outputs=summary['outputs'],
+        bump_count=summary['bump_count'],
+        zone_bumps=summary['zone_bumps'],
+        metrics=summary['metrics'],
+        warnings=summary['warnings'],
+        generate_elapsed=summary['elapsed'],
+        elapsed=time.time() - start_time,
+    )
+    return record
+
+
+def pool_context():
+    # Forked workers inherit the preloaded meshes, BVHs and heightmaps copy-on-write.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+def run_batch(jobs, workers):
+    """Run jobs across a process pool and return their records in manifest order."""
+    preload_assets(jobs)
+    context = pool_context()
+    # Spawned workers start empty, so they load the same assets in their initializer.
+    initializer, initargs = (None, ()) if context.get_start_method() == 'fork' else (preload_assets, (jobs,))
+    records = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=initializer, initargs=initargs) as executor:
+        futures = {executor.submit(run_batch_job, job): index for index, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:  # e.g. BrokenProcessPool when a worker dies; the batch still reports
+                record = {'name': jobs[index]['name'], 'foot': jobs[index]['foot'], 'zones': jobs[index]['zones'],
+                          'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+            records[index] = dict(record, index=index)
+            if record['status'] == 'ok':
+                print(f"✅ [{done}/{len(jobs)}] {record['name']}: {record['bump_count']} bumps in {record['elapsed']:.2f}s")
+            else:
+                print(f"❌ [{done}/{len(jobs)}] {record['name']}: {record['error']}", file=sys.stderr)
+    return records
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate many slippers from a JSON or CSV manifest in parallel.")
+    parser.add_argument('manifest', help='Job manifest (.json or .csv)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--output-dir', default='batch_output', help='Directory for jobs without an explicit output path')
+    parser.add_argument('--summary', help='Summary JSON path (default: <output-dir>/batch_summary.json)')
+    parser.add_argument('--metrics', choices=METRICS_MODES, help='Metrics mode for jobs that do not set one')
+    parser.add_argument('--zone-blocks', help='Directory of precomputed per-zone bump blocks for jobs that do not set one')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        jobs = load_manifest(args.manifest, args.output_dir)
+    except (OSError, ValueError, KeyError, csv.Error) as e:
+        print(f"❌ Error: Failed to read manifest '{args.manifest}': {e}", file=sys.stderr)
+        return 1
+    for job in jobs:
+        if args.metrics:
+            job['params'].setdefault('metrics', args.metrics)
+        if args.zone_blocks:
+            job['params'].setdefault('zone_blocks_dir', args.zone_blocks)
+    if not jobs:
+        print("⚠ Warning: Manifest contains no jobs.", file=sys.stderr)
+
+    start_time = time.time()
+    workers = max(1, min(args.workers, len(jobs) or 1))
+    records = run_batch(jobs, workers)
+    elapsed = time.time() - start_time
+    failed = sum(1 for record in records if record['status'] != 'ok')
+    summary = {
+        'manifest': args.manifest,
+        'workers': workers,
+        'jobs': len(records),
+        'succeeded': len(records) - failed,
+        'failed': failed,
+        'elapsed': elapsed,
+        'records': records,
+    }
+    summary_path = args.summary or os.path.join(args.output_dir, 'batch_summary.json')
+    if os.path.dirname(summary_path):
+        os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"📦 Batch done: {len(records) - failed}/{len(records)} jobs succeeded in {elapsed:.2f}s | Summary: '{summary_path}'")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import trimesh
+
+import slipper_engine
+from heightmap import load_heightmap
+from mesh_writer import EXPORT_FORMATS
+from profiling import Profile
+from ray_grid import load_ray_grid
+from slipper_engine import (DEFAULT_PARAMS, FEET, export_result, generate, get_sole, load_annotations, resolve_params,
+                            warm_up)
+
+# Profile spans recorded by slipper_engine.generate() and export_result(); a run fills the ones its engine uses.
+STAGES = ('stl_load', 'annotation_load', 'sampling', 'surface_lookup', 'bump_build', 'heightfield', 'concatenate',
+          'metrics', 'export')
+
+# Each sweep varies one setting; every other setting stays at its DEFAULT_PARAMS value.
+SWEEPS = {
+    'zones': [1, 4, 8, 16, 0],           # zone count, 0 = every annotated zone
+    'step': [10.0, 5.0, 3.0, 2.0],
+    'tessellation': [(8, 4), (20, 10), (32, 16), (48, 24)],
+    'subdivisions': [0, 1, 2, 3],        # synthetic soles, each level has 4x the triangles
+    'engine': ['instanced', 'heightfield'],
+    'lod': ['print', 'preview'],
+    'min_spacing': [0.0, 4.0, 6.0, 8.0],  # mm between bump centers across zones, 0 = off
+}
+QUICK_SWEEPS = {
+    'zones': [1, 0],
+    'step': [10.0, 5.0],
+    'tessellation': [(8, 4), (20, 10)],
+    'subdivisions': [0, 1],
+    'engine': ['instanced', 'heightfield'],
+    'lod': ['print', 'preview'],
+    'min_spacing': [0.0, 6.0],
+}
+
+
+def synthetic_sole(input_stl, subdivisions, directory):
+    """Write a copy of input_stl with every triangle split subdivisions times; returns its path."""
+    if subdivisions == 0:
+        path = os.path.join(directory, os.path.basename(input_stl))
+        if not os.path.exists(path):
+            shutil.copyfile(input_stl, path)
+        return path
+    path = os.path.join(directory, f"{os.path.splitext(os.path.basename(input_stl))[0]}_sub{subdivisions}.stl")
+    if not os.path.exists(path):
+        mesh = trimesh.load_mesh(input_stl)
+        vertices, faces = mesh.vertices, mesh.faces
+        for _ in range(subdivisions):
+            vertices, faces = trimesh.remesh.subdivide(vertices, faces)
+        trimesh.Trimesh(vertices=vertices, faces=faces, process=False).export(path)
+    return path
+
+
+def run_pipeline(foot, zones, params, output_file, formats):
+    """Generate and export once from a cold start; returns (seconds per stage, total seconds, counts).
+
+    Stage times are the engine's own profile spans.
+    """
+    slipper_engine.clear_caches()
+    profile = Profile()
+    result = generate(foot, zones, params, profile=profile)
+    export_result(result, output_file, formats, profile)
+    record = profile.record()
+    counters = record['counters']
+    counts = {
+        'sole_faces': len(get_sole(resolve_params(foot, params))['mesh'].faces),
+        'candidates': counters.get('candidates', 0),
+        'bumps': result['bump_count'],
+        'vertices': len(result['vertices']),
+        'faces': len(result['faces']),
+        'bytes_written': sum(value for key, value in counters.items() if key.startswith('bytes_written')),
+    }
+    return record['spans'], record['total'], counts
+
+
+def assets_missing(params):
+    """Whether the sole's ray grid or any heightmap its engine uses still has to be built."""
+    if load_ray_grid(params['input']) is None:
+        return True
+    if params['heightmap_res'] <= 0:
+        return False
+    surfaces = ('top', 'bottom') if params['engine'] == 'heightfield' else ('top',)
+    return any(load_heightmap(params['input'], params['heightmap_res'], surface) is None for surface in surfaces)
+
+
+def benchmark_case(foot, sweep, value, base_params, zone_names, work_dir, repeat, formats):
+    """Time one sweep point over repeat cold runs; returns its JSON record."""
+    params = dict(base_params)
+    zones = []
+    if sweep == 'zones':
+        zones = zone_names[:value] if value else []
+    elif sweep == 'step':
+        params['step'] = value
+    elif sweep == 'tessellation':
+        params['bump_sections'], params['bump_stacks'] = value
+    elif sweep == 'subdivisions':
+        params['input'] = synthetic_sole(base_params['input'], value, work_dir)
+    else:
+        params[sweep] = value
+    params = resolve_params(foot, params)
+
+    setup = {}
+    if assets_missing(params):
+        # Ray grids and heightmaps are a one-off per sole, so they are built before timing and reported apart.
+        start = time.perf_counter()
+        warm_up(foot, params)
+        setup['asset_build'] = time.perf_counter() - start
+
+    runs = []
+    totals = []
+    counts = None
+    for run in range(repeat):
+        seconds, total, counts = run_pipeline(foot, zones, params, os.path.join(work_dir, f"bench_{run}.ply"), formats)
+        runs.append(seconds)
+        totals.append(total)
+    stages = {}
+    for stage in STAGES:
+        samples = [seconds.get(stage, 0.0) for seconds in runs]
+        stages[stage] = {'median': float(np.median(samples)), 'min': float(np.min(samples)), 'runs': samples}
+    return {
+        'id': f"{sweep}={value if not isinstance(value, tuple) else 'x'.join(map(str, value))}",
+        'sweep': sweep,
+        'value': list(value) if isinstance(value, tuple) else value,
+        'params': {key: params[key] for key in ('step', 'bump_sections', 'bump_stacks', 'heightmap_res', 'metrics',
+                                                'engine', 'lod', 'min_spacing')},
+        'zones': len(zones) or len(zone_names),
+        'counts': counts,
+        'setup': setup,
+        'stages': stages,
+        'total': {'median': float(np.median(totals)), 'min': float(np.min(totals))},
+    }
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'trimesh': trimesh.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_results(results, baseline, threshold):
+    """Print per-stage median ratios against a baseline run; returns the regressed (case, stage) pairs."""
+    baseline_cases = {case['id']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        previous = baseline_cases.get(case['id'])
+        if previous is None:
+            continue
+        ratios = []
+        for stage in STAGES + ('total',):
+            now = case['total'] if stage == 'total' else case['stages'][stage]
+            before = previous['total'] if stage == 'total' else previous['stages'].get(stage)
+            if not before or before['median'] <= 0:
+                continue
+            ratio = now['median'] / before['median']
+            ratios.append(f"{stage} {ratio:.2f}x")
+            # Sub-millisecond stages are mostly timer noise.
+            if ratio > threshold and now['median'] - before['median'] > 0.001:
+                regressions.append((case['id'], stage))
+        print(f"  {case['id']}: " + ', '.join(ratios))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time every generation stage across zone count, step, tessellation, "
+                                                 "sole resolution, engine, level of detail and bump spacing.")
+    parser.add_argument('--foot', choices=FEET, default='left', help='Which foot to benchmark')
+    parser.add_argument('--input', help='Base sole STL (default: UK 8 sole for the foot)')
+    parser.add_argument('--sweeps', default=','.join(SWEEPS), help=f"Comma-separated sweeps to run ({', '.join(SWEEPS)})")
+    parser.add_argument('--repeat', type=int, default=3, help='Cold runs per sweep point')
+    parser.add_argument('--quick', action='store_true', help='Fewer sweep points, for a fast smoke run')
+    parser.add_argument('--metrics', choices=slipper_engine.METRICS_MODES, default=DEFAULT_PARAMS['metrics'], help='Metrics mode to time')
+    parser.add_argument('--formats', default=','.join(EXPORT_FORMATS), help='Comma-separated export formats to time')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare medians against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown ratio reported as a regression by --compare')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sweeps = QUICK_SWEEPS if args.quick else SWEEPS
+    selected = [name.strip() for name in args.sweeps.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in sweeps]
+    if unknown:
+        print(f"❌ Error: Unknown sweep(s): {', '.join(unknown)}", file=sys.stderr)
+        return 1
+    formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    base_params = resolve_params(args.foot, {'input': args.input, 'metrics': args.metrics})
+    annotations = load_annotations(base_params['annotations'])
+    zone_names = list(dict.fromkeys(annotations['category_names'][zone_id]
+                                    for zone_id in annotations['pack']['annotation_categories'].tolist()))
+
+    results = {'environment': environment_info(), 'foot': args.foot, 'repeat': args.repeat, 'cases': []}
+    work_dir = tempfile.mkdtemp(prefix='accufoot_bench_')
+    try:
+        # Benchmark copies of the inputs so cached heightmaps next to the real soles are left alone.
+        base_params['input'] = synthetic_sole(base_params['input'], 0, work_dir)
+        for sweep in selected:
+            for value in sweeps[sweep]:
+                case = benchmark_case(args.foot, sweep, value, base_params, zone_names, work_dir, args.repeat, formats)
+                results['cases'].append(case)
+                slowest = max(STAGES, key=lambda stage: case['stages'][stage]['median'])
+                print(f"⏱ {case['id']}: {case['total']['median']:.3f}s | {case['counts']['bumps']} bumps, "
+                      f"{case['counts']['faces']} faces | slowest stage: {slowest} {case['stages'][slowest]['median']:.3f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Benchmark results written to '{args.output}'")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print(f"\n📊 Median ratios against '{args.compare}' (commit {baseline['environment'].get('commit')}):")
+        regressions = compare_results(results, baseline, args.threshold)
+        for case_id, stage in regressions:
+            print(f"⚠ Regression: {case_id} {stage} is over {args.threshold:g}x slower", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+def enforce_min_spacing(points, min_distance, order=None):
+    """Greedily keep points so that no two kept points are closer than min_distance in x/y.
+
+    Points are visited in order (strongest claim first, default input order);
+    a point is kept unless an already kept point lies within min_distance.
+    Kept points are tracked in a spatial hash of min_distance-sized cells, so
+    each test only looks at the 3x3 neighbouring cells. Returns a boolean
+    keep mask over points.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0 or not min_distance or min_distance <= 0:
+        keep[:] = True
+        return keep
+    if order is None:
+        order = np.arange(count)
+    cells = np.floor(points[:, :2] / min_distance).astype(np.int64).tolist()
+    xs, ys = points[:, 0].tolist(), points[:, 1].tolist()
+    limit = min_distance * min_distance
+    accepted = {}
+    for i in np.asarray(order).tolist():
+        cx, cy = cells[i]
+        px, py = xs[i], ys[i]
+        clear = all(
+            (xs[j] - px) ** 2 + (ys[j] - py) ** 2 >= limit
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            for j in accepted.get((cx + dx, cy + dy), ()))
+        if clear:
+            keep[i] = True
+            accepted.setdefault((cx, cy), []).append(i)
+    return keep
@@ -0,0 +1,54 @@
+import numpy as np
+import trimesh
+
+SOLE_COLOR = trimesh.visual.DEFAULT_COLOR
+
+
+def create_ellipsoid_template(rx, ry, rz, sections=20, stacks=10):
+    """Build an upper-half ellipsoid bump centered at the origin as (vertices, faces)."""
+    u = np.linspace(0, 2 * np.pi, sections)
+    v = np.linspace(0, np.pi / 2, stacks)
+    u, v = np.meshgrid(u, v)
+    x = rx * np.cos(u) * np.sin(v)
+    y = ry * np.sin(u) * np.sin(v)
+    z = rz * np.cos(v)
+    vertices = np.stack((x.flatten(), y.flatten(), z.flatten()), axis=1)
+    i, j = np.meshgrid(np.arange(stacks - 1), np.arange(sections - 1), indexing='ij')
+    p0 = (i * sections + j).ravel()
+    p1 = p0 + 1
+    p2 = p0 + sections
+    p3 = p2 + 1
+    faces = np.stack((np.column_stack((p0, p2, p1)), np.column_stack((p1, p2, p3))), axis=1).reshape(-1, 3)
+    # Let trimesh merge the apex and seam duplicates once, for the template only.
+    template = trimesh.Trimesh(vertices=vertices, faces=faces)
+    return np.asarray(template.vertices), np.asarray(template.faces)
+
+
+def assemble_instances(base_vertices, base_faces, base_colors, template, centers, colors):
+    """Place one copy of a template at every center, appended after a base mesh.
+
+    Returns (vertices, faces, vertex_colors) written into single preallocated
+    arrays. colors holds one RGBA row per center.
+    """
+    template_vertices, template_faces = template
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    n_base_vertices, n_base_faces = len(base_vertices), len(base_faces)
+    n_template_vertices, n_template_faces = len(template_vertices), len(template_faces)
+    n_instances = len(centers)
+
+    vertices = np.empty((n_base_vertices + n_instances * n_template_vertices, 3), dtype=np.float64)
+    faces = np.empty((n_base_faces + n_instances * n_template_faces, 3), dtype=np.int64)
+    vertex_colors = np.empty((len(vertices), 4), dtype=np.uint8)
+
+    vertices[:n_base_vertices] = base_vertices
+    faces[:n_base_faces] = base_faces
+    vertex_colors[:n_base_vertices] = base_colors
+
+    instance_vertices = vertices[n_base_vertices:].reshape(n_instances, n_template_vertices, 3)
+    np.add(template_vertices[np.newaxis], centers[:, np.newaxis], out=instance_vertices)
+    offsets = n_base_vertices + np.arange(n_instances) * n_template_vertices
+    instance_faces = faces[n_base_faces:].reshape(n_instances, n_template_faces, 3)
+    np.add(template_faces[np.newaxis], offsets[:, np.newaxis, np.newaxis], out=instance_faces)
+    instance_colors = vertex_colors[n_base_vertices:].reshape(n_instances, n_template_vertices, 4)
+    instance_colors[:] = np.asarray(colors, dtype=np.uint8).reshape(-1, 1, 4)
+    return vertices, faces, vertex_colors
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import uuid
+from contextlib import suppress
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_stamp(path):
+    """Identify the contents of a file that a cache is derived from: {'sha256', 'source_size', 'source_mtime_ns'}."""
+    stat = os.stat(path)
+    return {'sha256': file_sha256(path), 'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def source_unchanged(meta, path):
+    """True when path still holds the contents stamped into meta by source_stamp.
+
+    An unchanged size and mtime is trusted without rehashing the file.
+    """
+    stat = os.stat(path)
+    if meta.get('source_size') == stat.st_size and meta.get('source_mtime_ns') == stat.st_mtime_ns:
+        return True
+    return meta.get('sha256') == file_sha256(path)
+
+
+def temporary_path(path, suffix=''):
+    """Unique sibling of path to build it under before renaming it into place.
+
+    Unique per call, not just per process: caches are also built lazily on
+    concurrent request threads.
+    """
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp{suffix}"
+
+
+def write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_atomic(path, writer, suffix=''):
+    """Write path by calling writer(tmp_path) and renaming the result into place.
+
+    Readers, and concurrent writers of the same path, never see a partial
+    file. suffix ends the temporary name for writers that append an
+    extension themselves, e.g. '.npy' for np.save.
+    """
+    tmp_path = temporary_path(path, suffix)
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return path
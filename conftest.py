@@ -0,0 +1,34 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+# The modules are flat files in the repository root; make them importable however pytest is run.
+sys.path.insert(0, REPO_ROOT)
+
+import slipper_engine  # noqa: E402
+
+FOOT_FILES = {
+    'left': ('Shoe_Sole_UK_8_Left.stl', 'Left_reflexology_zones.json'),
+    'right': ('Shoe_Sole_UK_8_Right.stl', 'Right_reflexology_zones.json'),
+}
+
+
+@pytest.fixture(scope='module')
+def sole_inputs(tmp_path_factory):
+    """Copies of each foot's sole and zone file as {foot: {'input', 'annotations'}}.
+
+    Packs, grids and heightmaps built for the copies stay out of the repo.
+    """
+    directory = tmp_path_factory.mktemp('inputs')
+    paths = {}
+    for foot, names in FOOT_FILES.items():
+        copies = []
+        for name in names:
+            copies.append(str(directory / name))
+            shutil.copyfile(os.path.join(REPO_ROOT, name), copies[-1])
+        paths[foot] = {'input': copies[0], 'annotations': copies[1]}
+    yield paths
+    slipper_engine.clear_caches()
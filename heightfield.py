@@ -0,0 +1,194 @@
+import numpy as np
+
+ENGINES = ('instanced', 'heightfield')
+NO_BUMP = -1
+# Cells per side of the tiles that surfaces are simplified in; a power of two.
+TILE_SIZE = 64
+
+
+def displacement_field(xs, ys, centers, radius, height):
+    """Raise half-ellipsoid bumps on a regular grid of nodes (xs columns, ys rows).
+
+    Every bump only touches the nodes within radius of its center; where bumps
+    overlap the higher one wins. Returns (field, owner): the displacement at
+    each node and the index of the bump that set it (NO_BUMP where none).
+    """
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    nx, ny = len(xs), len(ys)
+    field = np.zeros((ny, nx))
+    owner = np.full((ny, nx), NO_BUMP, dtype=np.int64)
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    if len(centers) == 0 or nx < 2 or ny < 2:
+        return field, owner
+    dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+    kx, ky = int(np.ceil(radius / dx)), int(np.ceil(radius / dy))
+    di, dj = np.meshgrid(np.arange(-ky, ky + 1), np.arange(-kx, kx + 1), indexing='ij')
+    rows = np.rint((centers[:, 1] - ys[0]) / dy).astype(np.int64)[:, np.newaxis] + di.ravel()
+    cols = np.rint((centers[:, 0] - xs[0]) / dx).astype(np.int64)[:, np.newaxis] + dj.ravel()
+    bumps = np.broadcast_to(np.arange(len(centers))[:, np.newaxis], rows.shape)
+    inside = (rows >= 0) & (rows < ny) & (cols >= 0) & (cols < nx)
+    rows, cols, bumps = rows[inside], cols[inside], bumps[inside]
+    d2 = ((xs[cols] - centers[bumps, 0]) ** 2 + (ys[rows] - centers[bumps, 1]) ** 2) / (radius * radius)
+    covered = d2 < 1
+    nodes = rows[covered] * nx + cols[covered]
+    values = height * np.sqrt(1 - d2[covered])
+    bumps = bumps[covered]
+
+    # Keep the highest value per node: sort by node, then value, and take each run's last entry.
+    order = np.lexsort((values, nodes))
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = nodes[order][1:] != nodes[order][:-1]
+    winners = order[last]
+    field.ravel()[nodes[winners]] = values[winners]
+    owner.ravel()[nodes[winners]] = bumps[winners]
+    return field, owner
+
+
+def _remove_pinches(cells):
+    """Drop cells until no two cells meet only at a corner, which would leave a non-manifold vertex."""
+    cells = cells.copy()
+    while True:
+        padded = np.pad(cells, 1)
+        a, b = padded[:-1, :-1], padded[:-1, 1:]
+        c, d = padded[1:, :-1], padded[1:, 1:]
+        pinch_ad = a & d & ~b & ~c
+        pinch_bc = b & c & ~a & ~d
+        if not (pinch_ad.any() or pinch_bc.any()):
+            return cells
+        # d and c are the cells up-right and up-left of each pinched node
+        drop = np.zeros_like(padded)
+        drop[1:, 1:] |= pinch_ad
+        drop[1:, :-1] |= pinch_bc
+        cells &= ~drop[1:-1, 1:-1]
+
+
+def _rtin_levels(size):
+    """Right triangles (a, b, c) of every level of the binary split of a size x size square.
+
+    c is the right-angle corner and a-b the hypotenuse; each level splits every
+    triangle of the one before at its hypotenuse midpoint. Coarsest first, down
+    to triangles of half a cell.
+    """
+    a = np.array([[0, 0], [size, size]])
+    b = np.array([[size, size], [0, 0]])
+    c = np.array([[0, size], [size, 0]])
+    levels = [(a, b, c)]
+    while np.abs(a[0] - c[0]).sum() > 1:
+        m = (a + b) // 2
+        a, b, c = np.concatenate((a, c)), np.concatenate((c, b)), np.concatenate((m, m))
+        levels.append((a, b, c))
+    return levels
+
+
+def simplify_heightfield(heights, cells, tolerance, tile_size=TILE_SIZE):
+    """Triangulate the included cells of a heightfield with as few right triangles as tolerance allows.
+
+    A right-triangulated irregular network: a triangle is split at its
+    hypotenuse midpoint while the surface there is more than tolerance away
+    from it. The error of a midpoint is shared by both triangles on that
+    hypotenuse and includes the errors below it, so the result has no
+    T-junctions. Triangles that touch an excluded cell stay at cell size, so
+    the outline follows cell edges. Returns (K, 3) flat node indices,
+    counter-clockwise seen from above.
+    """
+    ny, nx = heights.shape
+    tiles_y, tiles_x = -(-(ny - 1) // tile_size), -(-(nx - 1) // tile_size)
+    gy, gx = tiles_y * tile_size + 1, tiles_x * tile_size + 1
+    z = np.zeros((gy, gx))
+    z[:ny, :nx] = np.nan_to_num(heights)
+    included = np.zeros((gy - 1, gx - 1), dtype=bool)
+    included[:ny - 1, :nx - 1] = cells
+    # Cells with an excluded neighbour (or an excluded cell themselves) block merging
+    padded = np.pad(included, 1)
+    mergeable = np.ones_like(included)
+    for dy in range(3):
+        for dx in range(3):
+            mergeable &= padded[dy:dy + gy - 1, dx:dx + gx - 1]
+    blocked = np.zeros((gy, gx), dtype=np.int64)
+    blocked[1:, 1:] = np.cumsum(np.cumsum(~mergeable, axis=0), axis=1)
+
+    origin_y, origin_x = np.meshgrid(np.arange(tiles_y) * tile_size, np.arange(tiles_x) * tile_size, indexing='ij')
+    origin_x, origin_y = origin_x.ravel()[:, np.newaxis], origin_y.ravel()[:, np.newaxis]
+
+    def place(points):
+        return (points[:, 0] + origin_x).ravel(), (points[:, 1] + origin_y).ravel()
+
+    levels = _rtin_levels(tile_size)
+    errors = np.zeros(gy * gx)
+    for depth in range(len(levels) - 2, -1, -1):
+        (ax, ay), (bx, by), (cx, cy) = (place(points) for points in levels[depth])
+        mx, my = (ax + bx) // 2, (ay + by) // 2
+        error = np.abs((z[ay, ax] + z[by, bx]) / 2 - z[my, mx])
+        if depth < len(levels) - 2:
+            error = np.maximum(error, errors[((ay + cy) // 2) * gx + (ax + cx) // 2])
+            error = np.maximum(error, errors[((cy + by) // 2) * gx + (cx + bx) // 2])
+        x0, x1 = np.minimum(np.minimum(ax, bx), cx), np.maximum(np.maximum(ax, bx), cx)
+        y0, y1 = np.minimum(np.minimum(ay, by), cy), np.maximum(np.maximum(ay, by), cy)
+        error[blocked[y1, x1] - blocked[y0, x1] - blocked[y1, x0] + blocked[y0, x0] > 0] = np.inf
+        np.maximum.at(errors, my * gx + mx, error)
+
+    triangles = []
+    (ax, ay), (bx, by), (cx, cy) = (place(points) for points in levels[0])
+    for depth in range(len(levels)):
+        if depth == len(levels) - 1:
+            keep = included[np.minimum(np.minimum(ay, by), cy), np.minimum(np.minimum(ax, bx), cx)]
+            triangles.append(np.column_stack((ay * gx + ax, by * gx + bx, cy * gx + cx))[keep])
+            break
+        mx, my = (ax + bx) // 2, (ay + by) // 2
+        split = errors[my * gx + mx] > tolerance
+        triangles.append(np.column_stack((ay * gx + ax, by * gx + bx, cy * gx + cx))[~split])
+        ax, ay, bx, by, cx, cy, mx, my = (v[split] for v in (ax, ay, bx, by, cx, cy, mx, my))
+        ax, ay, bx, by, cx, cy = (np.concatenate(pair) for pair in
+                                  ((ax, cx), (ay, cy), (cx, bx), (cy, by), (mx, mx), (my, my)))
+    triangles = np.concatenate(triangles)
+
+    # Back to indices of the unpadded grid, wound counter-clockwise
+    rows, cols = triangles // gx, triangles % gx
+    triangles = rows * nx + cols
+    cross = ((cols[:, 1] - cols[:, 0]) * (rows[:, 2] - rows[:, 0]) -
+             (rows[:, 1] - rows[:, 0]) * (cols[:, 2] - cols[:, 0]))
+    triangles[cross < 0] = triangles[cross < 0][:, [0, 2, 1]]
+    return triangles
+
+
+def heightfield_solid(xs, ys, top, bottom, tolerance=0.0):
+    """Build one closed mesh between a top and a bottom heightfield on the same grid.
+
+    Nodes are (xs[j], ys[i]). Grid cells whose four corners have both
+    surfaces (top above bottom) are covered by the top and bottom surfaces,
+    each simplified to within tolerance (see simplify_heightfield), and every
+    outline edge gets a side wall. Returns (vertices, faces, top_nodes): the
+    first len(top_nodes) vertices are the top surface, at the flat grid node
+    indices in top_nodes.
+    """
+    top, bottom = np.asarray(top, dtype=np.float64), np.asarray(bottom, dtype=np.float64)
+    ny, nx = top.shape
+    valid = np.isfinite(top) & np.isfinite(bottom) & (top > bottom)
+    cells = _remove_pinches(valid[:-1, :-1] & valid[1:, :-1] & valid[:-1, 1:] & valid[1:, 1:])
+    top_faces = simplify_heightfield(top, cells, tolerance)
+    bottom_faces = simplify_heightfield(bottom, cells, tolerance)
+
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    top_nodes, top_faces = np.unique(top_faces, return_inverse=True)
+    bottom_nodes, bottom_faces = np.unique(bottom_faces, return_inverse=True)
+    count = len(top_nodes)
+    vertices = np.concatenate((
+        np.column_stack((xs[top_nodes % nx], ys[top_nodes // nx], top.ravel()[top_nodes])),
+        np.column_stack((xs[bottom_nodes % nx], ys[bottom_nodes // nx], bottom.ravel()[bottom_nodes]))))
+    top_vertex = np.full(ny * nx, -1, dtype=np.int64)
+    top_vertex[top_nodes] = np.arange(count)
+    bottom_vertex = np.full(ny * nx, -1, dtype=np.int64)
+    bottom_vertex[bottom_nodes] = count + np.arange(len(bottom_nodes))
+    faces = [top_faces.reshape(-1, 3), bottom_faces.reshape(-1, 3)[:, [0, 2, 1]] + count]
+
+    # Walls under every outline edge, taken in the direction its cell's boundary runs
+    # counter-clockwise: corners a (i, j), b (i, j+1), c (i+1, j+1), d (i+1, j)
+    ci, cj = np.nonzero(cells)
+    corners = (ci * nx + cj, ci * nx + cj + 1, (ci + 1) * nx + cj + 1, (ci + 1) * nx + cj)
+    padded = np.pad(cells, 1)
+    neighbours = (padded[ci, cj + 1], padded[ci + 1, cj + 2], padded[ci + 2, cj + 1], padded[ci + 1, cj])
+    for k, neighbour in enumerate(neighbours):
+        p, q = corners[k][~neighbour], corners[(k + 1) % 4][~neighbour]
+        faces.append(np.column_stack((top_vertex[q], top_vertex[p], bottom_vertex[p])))
+        faces.append(np.column_stack((top_vertex[q], bottom_vertex[p], bottom_vertex[q])))
+    return vertices, np.concatenate(faces), top_nodes
@@ -0,0 +1,103 @@
+import json
+import os
+
+import numpy as np
+
+from cache_files import source_stamp, source_unchanged, write_atomic, write_bytes
+
+
+def heightmap_paths(stl_path, resolution, surface='top'):
+    """Return the (.npy, .json) cache paths stored next to an STL file."""
+    name = 'heightmap' if surface == 'top' else f"heightmap_{surface}"
+    base = f"{os.path.splitext(stl_path)[0]}.{name}_{resolution:g}mm"
+    return base + '.npy', base + '.json'
+
+
+def build_heightmap(mesh, resolution, chunk_size=100000, surface='top', hits=None):
+    """Rasterize the top-surface (or bottom-surface) Z of a mesh on a regular XY grid.
+
+    Grid node (i, j) sits at (origin_x + j * resolution, origin_y + i * resolution).
+    Nodes where the vertical ray misses the mesh are NaN. hits(x, y, surface),
+    if given, answers the vertical rays instead of the mesh's BVH.
+    """
+    bounds = mesh.bounds
+    nx = int(np.ceil((bounds[1][0] - bounds[0][0]) / resolution)) + 1
+    ny = int(np.ceil((bounds[1][1] - bounds[0][1]) / resolution)) + 1
+    xs = bounds[0][0] + np.arange(nx) * resolution
+    ys = bounds[0][1] + np.arange(ny) * resolution
+    gx, gy = np.meshgrid(xs, ys)
+    if hits is not None:
+        heights = hits(gx.ravel(), gy.ravel(), surface)
+        return heights.astype(np.float32).reshape(ny, nx), (float(xs[0]), float(ys[0]))
+    if surface == 'top':
+        start_z, direction = bounds[1][2] + 10, [0.0, 0.0, -1.0]
+    else:
+        start_z, direction = bounds[0][2] - 10, [0.0, 0.0, 1.0]
+    ray_origins = np.column_stack((gx.ravel(), gy.ravel(), np.full(gx.size, start_z)))
+
+    heights = np.full(gx.size, np.nan, dtype=np.float32)
+    for start in range(0, len(ray_origins), chunk_size):
+        origins = ray_origins[start:start + chunk_size]
+        directions = np.tile(direction, (len(origins), 1))
+        locations, index_ray, _ = mesh.ray.intersects_location(origins, directions, multiple_hits=False)
+        heights[start + index_ray] = locations[:, 2]
+    return heights.reshape(ny, nx), (float(xs[0]), float(ys[0]))
+
+
+def save_heightmap(stl_path, mesh, resolution, surface='top', hits=None):
+    """Build the heightmap for an STL and persist it next to the file."""
+    npy_path, meta_path = heightmap_paths(stl_path, resolution, surface)
+    heights, origin = build_heightmap(mesh, resolution, surface=surface, hits=hits)
+    meta = dict(source_stamp(stl_path), surface=surface, resolution=resolution, origin=list(origin),
+                shape=list(heights.shape))
+    write_atomic(npy_path, lambda tmp_path: np.save(tmp_path, heights), suffix='.npy')
+    write_atomic(meta_path, lambda tmp_path: write_bytes(tmp_path, json.dumps(meta).encode('utf-8')))
+    return npy_path
+
+
+def load_heightmap(stl_path, resolution, surface='top'):
+    """Memory-map the cached heightmap for an STL.
+
+    Returns None when the cache is missing or was built from different STL contents.
+    """
+    npy_path, meta_path = heightmap_paths(stl_path, resolution, surface)
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('resolution') != resolution or not source_unchanged(meta, stl_path):
+            return None
+        heights = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if list(heights.shape) != meta.get('shape'):
+        return None
+    return {'heights': heights, 'origin': tuple(meta['origin']), 'resolution': resolution}
+
+
+def sample_heightmap(heightmap, x, y):
+    """Bilinearly interpolate surface Z at 3D (x, y) coordinates.
+
+    Points outside the grid, or whose surrounding cell touches a missing node, are NaN.
+    """
+    heights = heightmap['heights']
+    resolution = heightmap['resolution']
+    origin_x, origin_y = heightmap['origin']
+    fx = (np.asarray(x, dtype=np.float64) - origin_x) / resolution
+    fy = (np.asarray(y, dtype=np.float64) - origin_y) / resolution
+    ny, nx = heights.shape
+    inside = (fx >= 0) & (fy >= 0) & (fx <= nx - 1) & (fy <= ny - 1)
+
+    j0 = np.clip(np.floor(fx).astype(np.intp), 0, max(nx - 2, 0))
+    i0 = np.clip(np.floor(fy).astype(np.intp), 0, max(ny - 2, 0))
+    j1 = np.minimum(j0 + 1, nx - 1)
+    i1 = np.minimum(i0 + 1, ny - 1)
+    tx = np.clip(fx - j0, 0.0, 1.0)
+    ty = np.clip(fy - i0, 0.0, 1.0)
+
+    z = (heights[i0, j0] * (1 - tx) * (1 - ty) +
+         heights[i0, j1] * tx * (1 - ty) +
+         heights[i1, j0] * (1 - tx) * ty +
+         heights[i1, j1] * tx * ty)
+    return np.where(inside, z, np.nan)
@@ -0,0 +1,14 @@
+import numpy as np
+
+
+def expand_ranges(starts, counts):
+    """Concatenate range(start, start + count) over every (start, count) pair, without a Python loop.
+
+    Used to walk CSR-style indexes: with starts = cell_start[cells] and counts
+    the cells' entry counts it gives the index of every entry of every cell.
+    A scalar start of 0 gives each entry's position within its own range.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    return np.arange(total, dtype=np.int64) - np.repeat(ends - counts - np.asarray(starts, dtype=np.int64), counts)
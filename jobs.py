@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the pending queue is at capacity."""
+
+
+class JobManager:
+    """Runs submitted jobs on a bounded number of threads and tracks their progress.
+
+    Each job is a plain dict snapshot exposed through get(); its 'version'
+    increases on every change so watchers can wait for updates. Jobs sharing a
+    dedupe key while one is still pending are coalesced into the same job.
+    """
+
+    def __init__(self, max_concurrent, max_pending=100, max_finished=1000):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='job')
+        self._changed = threading.Condition()
+        self._jobs = OrderedDict()
+        self._active_by_key = {}
+
+    def submit(self, work, dedupe_key=None, **details):
+        """Queue work(job_id) and return the job snapshot.
+
+        work returns the job's result dict or raises; extra keyword arguments are
+        stored on the job for display.
+        """
+        with self._changed:
+            if dedupe_key is not None and dedupe_key in self._active_by_key:
+                return dict(self._jobs[self._active_by_key[dedupe_key]])
+            pending = sum(1 for job in self._jobs.values() if job['status'] == JOB_QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Too many pending jobs ({pending}).")
+            job_id = uuid.uuid4().hex
+            job = {
+                'id': job_id,
+                'status': JOB_QUEUED,
+                'progress': {},
+                'result': None,
+                'error': None,
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'version': 0,
+            }
+            job.update(details)
+            self._jobs[job_id] = job
+            if dedupe_key is not None:
+                self._active_by_key[dedupe_key] = job_id
+            self._trim()
+            snapshot = dict(job)
+        self._executor.submit(self._run, job_id, work, dedupe_key)
+        return snapshot
+
+    def add_finished(self, result, **details):
+        """Record a job that completed without running, e.g. served from a cache."""
+        with self._changed:
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            job = {
+                'id': job_id,
+                'status': JOB_DONE,
+                'progress': {},
+                'result': result,
+                'error': None,
+                'created': now,
+                'started': now,
+                'finished': now,
+                'version': 0,
+            }
+            job.update(details)
+            self._jobs[job_id] = job
+            self._trim()
+            return dict(job)
+
+    def _run(self, job_id, work, dedupe_key):
+        self._set(job_id, status=JOB_RUNNING, started=time.time())
+        try:
+            result = work(job_id)
+        except Exception as e:
+            self._set(job_id, status=JOB_FAILED, error=str(e), finished=time.time())
+        else:
+            self._set(job_id, status=JOB_DONE, result=result, finished=time.time())
+        finally:
+            with self._changed:
+                if dedupe_key is not None and self._active_by_key.get(dedupe_key) == job_id:
+                    del self._active_by_key[dedupe_key]
+
+    def _set(self, job_id, **fields):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job['version'] += 1
+            self._changed.notify_all()
+
+    def update_progress(self, job_id, **progress):
+        """Merge progress fields (e.g. stage, bumps_placed) into a job."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in FINISHED_STATES:
+                return
+            job['progress'] = dict(job['progress'], **progress)
+            job['version'] += 1
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait_for_change(self, job_id, version, timeout):
+        """Block until the job's version differs from version or timeout passes; returns the job."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]['version'] != version,
+                timeout=timeout)
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def counts(self):
+        with self._changed:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            return counts
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in FINISHED_STATES]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,39 @@
+import numpy as np
+
+LOD_MODES = ('preview', 'print')
+# Preview bumps are capped at this tessellation (sections, stacks); print uses the requested one.
+PREVIEW_BUMP_SECTIONS = 8
+PREVIEW_BUMP_STACKS = 4
+# Preview soles are clustered on a grid with this many cells along their longest side.
+PREVIEW_GRID_DIVISIONS = 128
+
+
+def cluster_decimate(vertices, faces, cell_size):
+    """Simplify a mesh by merging all vertices that fall in the same grid cell.
+
+    Each cell's vertices are replaced by their mean; faces that collapse
+    onto fewer than three vertices, and duplicates of another face, are
+    dropped. Returns (vertices, faces) holding only referenced vertices.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    _, cluster, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cluster = cluster.ravel()
+    clustered = np.column_stack([np.bincount(cluster, weights=vertices[:, axis], minlength=len(counts))
+                                 for axis in range(3)]) / counts[:, np.newaxis]
+
+    merged = cluster[faces]
+    valid = (merged[:, 0] != merged[:, 1]) & (merged[:, 1] != merged[:, 2]) & (merged[:, 0] != merged[:, 2])
+    merged = merged[valid]
+    _, first = np.unique(np.sort(merged, axis=1), axis=0, return_index=True)
+    merged = merged[np.sort(first)]
+
+    used, remapped = np.unique(merged, return_inverse=True)
+    return clustered[used], remapped.reshape(-1, 3)
+
+
+def preview_cell_size(vertices, divisions=PREVIEW_GRID_DIVISIONS):
+    """Clustering cell size for a preview of a mesh with the given vertices."""
+    extents = np.ptp(np.asarray(vertices), axis=0)
+    return float(extents.max()) / divisions
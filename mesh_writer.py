@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EXPORT_FORMATS = ('ply', 'stl')
+CHUNK_SIZE = 1 << 20  # elements per write, bounds the temporary buffers
+
+PLY_VERTEX_DTYPE = np.dtype([
+    ('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+    ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('alpha', 'u1'),
+])
+PLY_FACE_DTYPE = np.dtype([('count', 'u1'), ('vertex_indices', '<i4', (3,))])
+STL_FACE_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attributes', '<u2')])
+
+
+def write_ply(path, vertices, faces, vertex_colors):
+    """Write a binary little-endian PLY with per-vertex RGBA colors."""
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(vertices)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "property uchar red\n"
+        "property uchar green\n"
+        "property uchar blue\n"
+        "property uchar alpha\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        for start in range(0, len(vertices), CHUNK_SIZE):
+            chunk = slice(start, start + CHUNK_SIZE)
+            block = np.empty(len(vertices[chunk]), dtype=PLY_VERTEX_DTYPE)
+            xyz = np.asarray(vertices[chunk])
+            block['x'], block['y'], block['z'] = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+            rgba = np.asarray(vertex_colors[chunk])
+            block['red'], block['green'], block['blue'], block['alpha'] = rgba[:, 0], rgba[:, 1], rgba[:, 2], rgba[:, 3]
+            block.tofile(f)
+        for start in range(0, len(faces), CHUNK_SIZE):
+            chunk = faces[start:start + CHUNK_SIZE]
+            block = np.empty(len(chunk), dtype=PLY_FACE_DTYPE)
+            block['count'] = 3
+            block['vertex_indices'] = chunk
+            block.tofile(f)
+    return path
+
+
+def write_stl(path, vertices, faces):
+    """Write a binary STL with per-face unit normals."""
+    vertices = np.asarray(vertices)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 80)
+        np.array([len(faces)], dtype='<u4').tofile(f)
+        for start in range(0, len(faces), CHUNK_SIZE):
+            triangles = vertices[np.asarray(faces[start:start + CHUNK_SIZE])].astype(np.float64)
+            normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+            lengths = np.linalg.norm(normals, axis=1)
+            nonzero = lengths > 0
+            normals[nonzero] /= lengths[nonzero, np.newaxis]
+            block = np.zeros(len(triangles), dtype=STL_FACE_DTYPE)
+            block['normal'] = normals
+            block['vertices'] = triangles
+            block.tofile(f)
+    return path
+
+
+def output_paths(output_file, formats=EXPORT_FORMATS):
+    """Return {format: path} for an output file name, swapping in each format's extension."""
+    base = os.path.splitext(output_file)[0]
+    return {fmt: f"{base}.{fmt}" for fmt in formats}
+
+
+def write_mesh(paths, vertices, faces, vertex_colors):
+    """Write a mesh in every format of paths ({format: path}), concurrently when several.
+
+    Returns the same mapping once all files are written.
+    """
+    unknown = set(paths) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unsupported export format(s): {', '.join(sorted(unknown))}")
+    writers = {
+        'ply': lambda path: write_ply(path, vertices, faces, vertex_colors),
+        'stl': lambda path: write_stl(path, vertices, faces),
+    }
+    if len(paths) == 1:
+        for fmt, path in paths.items():
+            writers[fmt](path)
+        return dict(paths)
+    # numpy and file I/O release the GIL, so the writers overlap on separate threads.
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        futures = [executor.submit(writers[fmt], path) for fmt, path in paths.items()]
+        for future in futures:
+            future.result()
+    return dict(paths)
@@ -0,0 +1,101 @@
+import numpy as np
+
+from index_ranges import expand_ranges
+from zone_raster import NO_ZONE
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional; fall back to a grid spatial hash
+    cKDTree = None
+
+METRICS_MODES = ('off', 'fast', 'full')
+
+
+def _nearest_distances_kdtree(points):
+    distances, _ = cKDTree(points).query(points, k=2)
+    return distances[:, 1]
+
+
+def _nearest_distances_grid(points):
+    """Exact nearest-neighbour distances using a uniform grid spatial hash."""
+    n = len(points)
+    extent = np.ptp(points[:, :2], axis=0)
+    area = max(float(extent[0] * extent[1]), 1e-9)
+    cell_size = max(2.0 * np.sqrt(area / n), 1e-6)
+    cells = np.floor(points / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 3
+    keys = ((cells[:, 0] + 1) * dims[1] + (cells[:, 1] + 1)) * dims[2] + (cells[:, 2] + 1)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    best = np.full(n, np.inf)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                neighbour_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+                starts = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+                ends = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+                counts = ends - starts
+                if not counts.any():
+                    continue
+                source = np.repeat(np.arange(n), counts)
+                target = order[expand_ranges(starts, counts)]
+                keep = source != target
+                source, target = source[keep], target[keep]
+                distances = np.linalg.norm(points[source] - points[target], axis=1)
+                np.minimum.at(best, source, distances)
+
+    # A neighbour further than one cell may hide a closer one outside the 3x3x3 block.
+    unresolved = np.flatnonzero(best > cell_size)
+    for i in unresolved:
+        distances = np.linalg.norm(points - points[i], axis=1)
+        distances[i] = np.inf
+        best[i] = distances.min()
+    return best
+
+
+def nearest_neighbor_spacing(locations):
+    """Distance from each bump to its nearest bump at a different location.
+
+    Coincident bumps are measured against the nearest distinct location; bumps
+    with no distinct neighbour are dropped, matching the brute-force definition.
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    if len(locations) < 2:
+        return np.empty(0)
+    unique_points, inverse = np.unique(locations, axis=0, return_inverse=True)
+    if len(unique_points) < 2:
+        return np.empty(0)
+    if cKDTree is not None:
+        unique_spacing = _nearest_distances_kdtree(unique_points)
+    else:
+        unique_spacing = _nearest_distances_grid(unique_points)
+    return unique_spacing[inverse.ravel()]
+
+
+def zone_hits_fast(points_2d, label_raster):
+    """Return a mask of image points that fall on a labelled pixel of the raster."""
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+    height, width = label_raster.shape
+    cols = np.floor(points_2d[:, 0]).astype(np.intp)
+    rows = np.floor(points_2d[:, 1]).astype(np.intp)
+    inside = (cols >= 0) & (rows >= 0) & (cols < width) & (rows < height)
+    hits = np.zeros(len(points_2d), dtype=bool)
+    hits[inside] = label_raster[rows[inside], cols[inside]] != NO_ZONE
+    return hits
+
+
+def zone_hits_full(points_2d, zone_paths):
+    """Return a mask of image points inside any zone polygon, tested exactly.
+
+    zone_paths maps each zone name to the list of its annotation Paths.
+    """
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+    hits = np.zeros(len(points_2d), dtype=bool)
+    for path in (path for paths in zone_paths.values() for path in paths):
+        remaining = np.flatnonzero(~hits)
+        if len(remaining) == 0:
+            break
+        hits[remaining] = path.contains_points(points_2d[remaining])
+    return hits
@@ -0,0 +1,163 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = 'accufoot'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in sorted(labels.items())) + '}'
+
+
+def counter_key(name, labels=None):
+    """Key for a counter with optional labels, e.g. bumps{zone="kidney"}."""
+    return name + _labels_text(labels)
+
+
+class Profile:
+    """Wall-clock spans and counters for one generation request.
+
+    Spans with the same name accumulate. record() returns a JSON-ready dict.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, value=1, **labels):
+        key = counter_key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self):
+        return {
+            'spans': dict(self.spans),
+            'counters': dict(self.counters),
+            'total': time.perf_counter() - self.started,
+        }
+
+
+@contextmanager
+def cprofiled(path):
+    """Run the block under cProfile and dump the stats to path; does nothing when path is None."""
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe aggregation of profile records into Prometheus histograms and counters."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels key) -> _Histogram
+        self._counters = {}    # (name, labels text) -> value
+        self._gauges = {}
+        self._help = {}
+
+    def observe(self, name, value, help_text='', **labels):
+        with self._lock:
+            key = (name, _labels_text(labels))
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(self.buckets)
+            self._histograms[key].observe(value)
+            self._help.setdefault(name, help_text)
+
+    def inc(self, name, value=1, help_text='', **labels):
+        self._add_counter(name, _labels_text(labels), value, help_text)
+
+    def _add_counter(self, name, labels, value, help_text):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+            self._help.setdefault(name, help_text)
+
+    def set_counter(self, name, value, help_text='', **labels):
+        """Export a count kept elsewhere, which only ever grows, as a counter."""
+        with self._lock:
+            self._counters[(name, _labels_text(labels))] = value
+            self._help.setdefault(name, help_text)
+
+    def set_gauge(self, name, value, help_text='', **labels):
+        with self._lock:
+            self._gauges[(name, _labels_text(labels))] = value
+            self._help.setdefault(name, help_text)
+
+    def add_record(self, record):
+        """Fold one Profile.record() into the stage latency histograms and counters."""
+        for stage, seconds in record['spans'].items():
+            self.observe(f"{METRIC_PREFIX}_stage_seconds", seconds, 'Time spent per generation stage.', stage=stage)
+        self.observe(f"{METRIC_PREFIX}_generation_seconds", record['total'], 'Generation time inside the engine worker.')
+        for key, value in record['counters'].items():
+            name, brace, labels = key.partition('{')
+            self._add_counter(f"{METRIC_PREFIX}_{name}_total", brace + labels, value, f"Generation counter '{name}'.")
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for kind, series in (('histogram', self._histograms), ('counter', self._counters), ('gauge', self._gauges)):
+                names = sorted({name for name, _ in series})
+                for name in names:
+                    lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if kind == 'histogram':
+                            lines.extend(self._histogram_lines(name, labels, value))
+                        else:
+                            lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram_lines(name, labels, histogram):
+        inner = labels[1:-1]
+        prefix = inner + ',' if inner else ''
+        lines = [f'{name}_bucket{{{prefix}le="{bound:g}"}} {count}' for bound, count in zip(histogram.buckets, histogram.counts)]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{labels} {histogram.total}")
+        lines.append(f"{name}_count{labels} {histogram.count}")
+        return lines
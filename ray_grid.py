@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+
+from cache_files import source_stamp, source_unchanged, write_atomic, write_bytes
+from index_ranges import expand_ranges
+
+# Query points handled at once; bounds the (point, triangle) candidate pairs held in memory.
+QUERY_CHUNK = 100000
+GRID_ARRAYS = ('cell_start', 'triangles')
+MESH_ARRAYS = ('vertices', 'faces')
+
+
+def ray_grid_paths(stl_path):
+    """Return the (.json, {array name: .npy}) paths of the ray grid stored next to an STL file."""
+    base = f"{os.path.splitext(stl_path)[0]}.raygrid"
+    return base + '.json', {name: f"{base}.{name}.npy" for name in GRID_ARRAYS + MESH_ARRAYS}
+
+
+def build_ray_grid(vertices, faces, cell_size=None):
+    """Bin triangles into the uniform XY cells their bounding boxes overlap.
+
+    Vertical rays only have to test the triangles of the one cell they pass
+    through. The default cell size gives about one cell per triangle. Returns
+    {'origin', 'cell_size', 'shape', 'cell_start', 'triangles'}: the triangles
+    of cell c are triangles[cell_start[c]:cell_start[c + 1]].
+    """
+    corners = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)][:, :, :2]
+    low, high = corners.min(axis=1), corners.max(axis=1)
+    origin = low.min(axis=0)
+    extent = np.maximum(high.max(axis=0) - origin, 1e-9)
+    if cell_size is None:
+        cell_size = float(np.sqrt(extent[0] * extent[1] / max(len(corners), 1)))
+    nx, ny = (np.floor(extent / cell_size).astype(np.int64) + 1).tolist()
+    col0, row0 = np.floor((low - origin) / cell_size).astype(np.int64).T
+    col1, row1 = np.minimum(np.floor((high - origin) / cell_size).astype(np.int64), [nx - 1, ny - 1]).T
+
+    widths = col1 - col0 + 1
+    counts = widths * (row1 - row0 + 1)
+    triangle = np.repeat(np.arange(len(counts)), counts)
+    k = expand_ranges(0, counts)
+    cells = (row0[triangle] + k // widths[triangle]) * nx + col0[triangle] + k % widths[triangle]
+    order = np.argsort(cells, kind='stable')
+    cell_start = np.zeros(nx * ny + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=nx * ny), out=cell_start[1:])
+    return {
+        'origin': origin,
+        'cell_size': float(cell_size),
+        'shape': (ny, nx),
+        'cell_start': cell_start,
+        'triangles': triangle[order].astype(np.int32 if len(counts) < 2 ** 31 else np.int64),
+    }
+
+
+def vertical_hits(grid, vertices, faces, x, y, surface='top'):
+    """Z where vertical lines through (x, y) meet the mesh: the highest hit for 'top', the lowest for 'bottom'.
+
+    Matches the first hit of a downward (upward) ray cast from above (below)
+    the mesh. Points whose line misses every triangle get NaN.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    z = np.full(len(x), np.nan)
+    ny, nx = grid['shape']
+    col = np.floor((x - grid['origin'][0]) / grid['cell_size']).astype(np.int64)
+    row = np.floor((y - grid['origin'][1]) / grid['cell_size']).astype(np.int64)
+    inside = np.flatnonzero((col >= 0) & (col < nx) & (row >= 0) & (row < ny))
+    for start in range(0, len(inside), QUERY_CHUNK):
+        points = inside[start:start + QUERY_CHUNK]
+        cells = row[points] * nx + col[points]
+        first, counts = grid['cell_start'][cells], grid['cell_start'][cells + 1] - grid['cell_start'][cells]
+        point = np.repeat(points, counts)
+        corners = vertices[faces[grid['triangles'][expand_ranges(first, counts)]]]
+        a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+        px, py = x[point], y[point]
+        # Barycentric coordinates of the point in each candidate triangle's XY projection
+        denom = (b[:, 1] - c[:, 1]) * (a[:, 0] - c[:, 0]) + (c[:, 0] - b[:, 0]) * (a[:, 1] - c[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wa = ((b[:, 1] - c[:, 1]) * (px - c[:, 0]) + (c[:, 0] - b[:, 0]) * (py - c[:, 1])) / denom
+            wb = ((c[:, 1] - a[:, 1]) * (px - c[:, 0]) + (a[:, 0] - c[:, 0]) * (py - c[:, 1])) / denom
+            wc = 1 - wa - wb
+        tolerance = -1e-9
+        hit = (denom != 0) & (wa >= tolerance) & (wb >= tolerance) & (wc >= tolerance)
+        hit_z = wa[hit] * a[hit, 2] + wb[hit] * b[hit, 2] + wc[hit] * c[hit, 2]
+        if surface == 'top':
+            best = np.full(len(x), -np.inf)
+            np.maximum.at(best, point[hit], hit_z)
+        else:
+            best = np.full(len(x), np.inf)
+            np.minimum.at(best, point[hit], hit_z)
+        found = points[np.isfinite(best[points])]
+        z[found] = best[found]
+    return z
+
+
+def save_ray_grid(stl_path, grid, vertices=None, faces=None):
+    """Persist a ray grid next to its STL, tagged with the STL's contents.
+
+    The merged mesh the grid indexes can be stored with it, so later loads of
+    the STL skip merging its corners. Each array is its own .npy file and the
+    JSON metadata, written last, lists the ones that belong to this save.
+    """
+    meta_path, array_paths = ray_grid_paths(stl_path)
+    arrays = {name: np.asarray(grid[name]) for name in GRID_ARRAYS}
+    if vertices is not None:
+        arrays.update(vertices=np.asarray(vertices), faces=np.asarray(faces))
+    for name, array in arrays.items():
+        write_atomic(array_paths[name], lambda tmp_path: np.save(tmp_path, array), suffix='.npy')
+    meta = dict(source_stamp(stl_path), origin=np.asarray(grid['origin']).tolist(),
+                cell_size=float(grid['cell_size']), shape=[int(n) for n in grid['shape']],
+                arrays={name: list(array.shape) for name, array in arrays.items()})
+    write_atomic(meta_path, lambda tmp_path: write_bytes(tmp_path, json.dumps(meta).encode('utf-8')))
+    return meta_path
+
+
+def load_ray_grid(stl_path):
+    """Load the persisted ray grid for an STL, or None when missing or built from different contents.
+
+    The grid's arrays are memory-mapped read-only, so only the cells rays pass
+    through are paged in. When the mesh was saved with the grid it is read
+    in full and returned as 'vertices' and 'faces'.
+    """
+    meta_path, array_paths = ray_grid_paths(stl_path)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if not source_unchanged(meta, stl_path):
+            return None
+        grid = {
+            'origin': np.asarray(meta['origin'], dtype=np.float64),
+            'cell_size': float(meta['cell_size']),
+            'shape': tuple(int(n) for n in meta['shape']),
+        }
+        for name, shape in meta['arrays'].items():
+            grid[name] = np.load(array_paths[name], mmap_mode='r' if name in GRID_ARRAYS else None)
+            if list(grid[name].shape) != shape:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
+    if any(name not in grid for name in GRID_ARRAYS):
+        return None
+    return grid
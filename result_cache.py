@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from cache_files import file_sha256
+
+_ENTRY_PATTERN = re.compile(r'^([0-9a-f]{64})\.ply$')
+_PARTIAL_PATTERN = re.compile(r'^[0-9a-f]{64}\..+\.partial\.')
+# Temporary outputs older than this at startup belong to generations that died; younger ones may
+# still be written by another process sharing the directory.
+PARTIAL_MAX_AGE_SECONDS = 3600
+# Files kept per entry; the PLY marks a complete entry and is moved in last.
+CACHED_FORMATS = ('stl', 'wmesh', 'wmesh.gz', 'wmesh.br', 'ply')
+# Part of every cache key. Bump it whenever a code change alters the generated geometry, so
+# results of the old code are neither served nor mistaken for the new ones by clients holding
+# the immutable URLs.
+GENERATOR_VERSION = 1
+_file_hashes = {}
+
+
+def cached_file_sha256(path):
+    """SHA-256 of a file, recomputed only when its size or mtime changes."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        digest = file_sha256(path)
+        _file_hashes[key] = digest
+    return digest
+
+
+def result_cache_key(foot, size, zones, bump_params, input_stl, annotation_path):
+    """Hash everything that determines a generated slipper into a cache key.
+
+    Zone order is kept only under the 'selection' overlap rule, where it decides which zone owns a contested point.
+    """
+    zones = list(dict.fromkeys(zone.lower() for zone in zones))
+    payload = {
+        'generator_version': GENERATOR_VERSION,
+        'foot': foot,
+        'size': str(size),
+        'zones': zones if bump_params.get('overlap_rule') == 'selection' else sorted(zones),
+        'params': bump_params,
+        'input_sha256': cached_file_sha256(input_stl),
+        'annotations_sha256': cached_file_sha256(annotation_path),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Directory of generated <key>.ply files and their companions with a size limit and LRU eviction.
+
+    Recency is kept in file mtimes, so it survives restarts and is shared by
+    every process that points at the same directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> bytes on disk, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        now = time.time()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            match = _ENTRY_PATTERN.match(name)
+            if match:
+                found.append((os.path.getmtime(path), match.group(1)))
+            elif _PARTIAL_PATTERN.match(name):
+                try:
+                    if now - os.path.getmtime(path) > PARTIAL_MAX_AGE_SECONDS:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for _, key in sorted(found):
+            self._entries[key] = self._entry_size(key)
+
+    def file_name(self, key, fmt):
+        return f"{key}.{fmt}"
+
+    def ply_name(self, key):
+        return self.file_name(key, 'ply')
+
+    def _paths(self, key):
+        return [os.path.join(self.directory, self.file_name(key, fmt)) for fmt in CACHED_FORMATS]
+
+    def _entry_size(self, key):
+        return sum(os.path.getsize(path) for path in self._paths(key) if os.path.exists(path))
+
+    def get(self, key):
+        """Return the cached PLY path for key and mark it most recently used, or None."""
+        ply_path = os.path.join(self.directory, self.ply_name(key))
+        with self._lock:
+            if not os.path.exists(ply_path):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            if key not in self._entries:  # written by another process
+                self._entries[key] = self._entry_size(key)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(ply_path)
+        except OSError:
+            pass
+        return ply_path
+
+    def temp_output_path(self, key, token):
+        """Return a unique PLY path inside the cache directory for a generation in progress."""
+        return os.path.join(self.directory, f"{key}.{token}.partial.ply")
+
+    def discard_temp_outputs(self, key, token):
+        """Remove whatever a generation left at temp_output_path(key, token) in any format."""
+        prefix = f"{key}.{token}.partial."
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def put(self, key, outputs):
+        """Move a finished generation's files ({format: path}, PLY required) into the cache under key.
+
+        Formats outside CACHED_FORMATS are ignored. Evicts to the size limit afterwards.
+        """
+        for fmt in CACHED_FORMATS:
+            path = outputs.get(fmt)
+            if path and os.path.exists(path):
+                os.replace(path, os.path.join(self.directory, self.file_name(key, fmt)))
+        final_ply = os.path.join(self.directory, self.ply_name(key))
+        with self._lock:
+            self._entries[key] = self._entry_size(key)
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        return final_ply
+
+    def _evict(self, keep):
+        total = sum(self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= self._entries.pop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
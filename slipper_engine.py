@@ -0,0 +1,911 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import trimesh
+from matplotlib.path import Path
+
+from annotation_pack import annotation_polygon, get_annotation_pack, zones_at
+from bump_templates import SOLE_COLOR, assemble_instances, create_ellipsoid_template
+from bump_spacing import enforce_min_spacing
+from heightfield import ENGINES, NO_BUMP, displacement_field, heightfield_solid
+from heightmap import load_heightmap, sample_heightmap, save_heightmap
+from mesh_lod import LOD_MODES, PREVIEW_BUMP_SECTIONS, PREVIEW_BUMP_STACKS, cluster_decimate, preview_cell_size
+from mesh_writer import EXPORT_FORMATS, output_paths, write_mesh
+from metrics import METRICS_MODES, nearest_neighbor_spacing, zone_hits_fast, zone_hits_full
+from profiling import Profile, cprofiled
+from ray_grid import build_ray_grid, load_ray_grid, save_ray_grid, vertical_hits
+from result_cache import GENERATOR_VERSION, cached_file_sha256
+from sole_sizes import BASE_UK_SIZE, parse_uk_size, size_scale, sized_input_path
+from stl_loader import load_binary_stl, mmap_binary_stl
+from web_mesh import WEB_MESH_FORMAT, write_web_mesh
+from zone_blocks import compose_zone_blocks, load_zone_blocks, prune_zone_blocks, save_zone_blocks
+from zone_raster import (OWNERSHIP_RULES, compile_label_raster, grid_cells, ownership_order, sample_label_grid,
+                         selection_ranks)
+
+FEET = ('left', 'right')
+
+# --- Default Generation Parameters ---
+DEFAULT_PARAMS = {
+    'input': None,          # sole STL path, defaults to the UK 8 sole for the foot
+    'annotations': None,    # COCO zone file, defaults to <Foot>_reflexology_zones.json
+    'size': None,           # UK size; derived from the UK 8 input sole unless a per-size STL exists
+    'bump_radius': 2.5,     # mm
+    'bump_height': 4.0,     # mm
+    'step': 5.0,            # mm, spacing between bump centers
+    'bump_sections': 20,
+    'bump_stacks': 10,
+    'heightmap_res': 1.0,   # mm, 0 disables the heightmap cache
+    'min_spacing': 0.0,     # mm, minimum distance between bump centers across zones, 0 disables
+    'overlap_rule': 'smallest',  # smallest | largest | selection, which zone owns a contested point
+    'lod': 'print',         # preview (coarse bumps, decimated sole) | print
+    'engine': 'instanced',  # instanced (ellipsoid per bump) | heightfield (one displaced solid on the heightmap grid)
+    'heightfield_tolerance': 0.05,  # mm, how far the simplified heightfield surfaces may deviate from the grid
+    'metrics': 'full',      # off | fast | full
+    'zone_blocks_dir': None,  # precomputed per-zone bump blocks, used when metrics is off
+}
+
+# Parameters that change the generated geometry; file inputs are identified by content instead.
+GEOMETRY_PARAMS = ('size', 'bump_radius', 'bump_height', 'step', 'bump_sections', 'bump_stacks', 'heightmap_res',
+                   'lod')
+# Parameters that change the result but not the precomputed zone blocks.
+RESULT_PARAMS = GEOMETRY_PARAMS + ('min_spacing', 'overlap_rule', 'engine', 'heightfield_tolerance')
+
+# --- Color Mapping for Reflexology Zones ---
+ZONE_COLOR_MAP = {
+    "adrenal_gland": [255, 165, 0, 255],
+    "appendix": [139, 69, 19, 255],
+    "ascending_colon": [153, 102, 51, 255],
+    "bladder": [255, 215, 0, 255],
+    "brain_stem": [128, 0, 128, 255],
+    "descending_colon": [139, 69, 19, 255],
+    "duodenum": [210, 105, 30, 255],
+    "ear": [255, 192, 203, 255],
+    "eye": [0, 191, 255, 255],
+    "gall_bladder": [50, 205, 50, 255],
+    "head_brain": [147, 112, 219, 255],
+    "heart": [255, 0, 0, 255],
+    "anus": [139, 0, 0, 255],
+    "kidney": [205, 92, 92, 255],
+    "liver": [165, 42, 42, 255],
+    "lungs": [135, 206, 235, 255],
+    "neck": [255, 228, 196, 255],
+    "pancreas": [255, 140, 0, 255],
+    "pituitary_gland": [255, 105, 180, 255],
+    "rectum": [128, 0, 0, 255],
+    "sex_gland": [199, 21, 133, 255],
+    "sinus": [173, 216, 230, 255],
+    "small_intestine": [244, 164, 96, 255],
+    "solar_plexus": [255, 255, 0, 255],
+    "spleen": [220, 20, 60, 255],
+    "stomach": [240, 128, 128, 255],
+    "thyroid": [0, 128, 128, 255],
+    "trapezoid": [238, 130, 238, 255],
+    "transverse_colon": [160, 82, 45, 255],
+    "ureter": [218, 165, 32, 255],
+    "default": [128, 128, 128, 255]
+}
+
+
+class GenerationError(Exception):
+    """Raised when a slipper cannot be generated from the given inputs."""
+
+
+# --- Loaded assets, kept for the lifetime of the process ---
+SOLE_CACHE_SIZE = 8          # loaded and size-derived soles, least recently used evicted first
+ZONE_BLOCK_CACHE_SIZE = 8    # loaded zone block sets
+_sole_cache = OrderedDict()
+_sole_bounds_cache = {}
+_annotation_cache = {}
+_zone_block_cache = OrderedDict()
+_progress_queue = None  # set in pool workers to forward job progress to the parent
+
+
+def default_input_path(foot):
+    return f"Shoe_Sole_UK_8_{'Left' if foot == 'left' else 'Right'}.stl"
+
+
+def default_annotation_path(foot):
+    return f"{'Left' if foot == 'left' else 'Right'}_reflexology_zones.json"
+
+
+def resolve_params(foot, params=None):
+    """Merge caller params over DEFAULT_PARAMS and fill in per-foot file paths."""
+    resolved = dict(DEFAULT_PARAMS)
+    resolved.update(params or {})
+    if not resolved['input']:
+        resolved['input'] = default_input_path(foot)
+    if not resolved['annotations']:
+        resolved['annotations'] = default_annotation_path(foot)
+    if resolved['metrics'] not in METRICS_MODES:
+        raise GenerationError(f"Unknown metrics mode '{resolved['metrics']}'.")
+    if resolved['engine'] not in ENGINES:
+        raise GenerationError(f"Unknown geometry engine '{resolved['engine']}'.")
+    if resolved['engine'] == 'heightfield' and not resolved['heightmap_res'] > 0:
+        raise GenerationError("The heightfield engine needs a heightmap resolution above 0.")
+    if resolved['lod'] not in LOD_MODES:
+        raise GenerationError(f"Unknown level of detail '{resolved['lod']}'.")
+    if resolved['lod'] == 'preview':
+        resolved['bump_sections'] = min(resolved['bump_sections'], PREVIEW_BUMP_SECTIONS)
+        resolved['bump_stacks'] = min(resolved['bump_stacks'], PREVIEW_BUMP_STACKS)
+    if resolved['overlap_rule'] not in OWNERSHIP_RULES:
+        raise GenerationError(f"Unknown overlap rule '{resolved['overlap_rule']}'.")
+    resolved['min_spacing'] = float(resolved['min_spacing'] or 0)
+    if resolved['min_spacing'] < 0:
+        raise GenerationError("Minimum bump spacing cannot be negative.")
+    resolved['scale'] = None
+    if resolved['size'] is not None:
+        try:
+            resolved['size'] = parse_uk_size(resolved['size'])
+        except ValueError as e:
+            raise GenerationError(str(e)) from e
+        if resolved['size'] == BASE_UK_SIZE:
+            # The base size is the unscaled input, so it shares size=None's blocks and cache keys
+            resolved['size'] = None
+        else:
+            sized_path = sized_input_path(resolved['input'], resolved['size'])
+            if sized_path:
+                resolved['input'] = sized_path
+            else:
+                resolved['scale'] = size_scale(resolved['size'])
+    return resolved
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def clear_caches():
+    """Drop every loaded sole, annotation file and zone block set."""
+    _sole_cache.clear()
+    _sole_bounds_cache.clear()
+    _annotation_cache.clear()
+    _zone_block_cache.clear()
+
+
+def _cache_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _cache_put(cache, key, value, limit):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def load_sole(input_stl, heightmap_res=0):
+    """Load a sole STL with its ray accelerator and heightmap cache, reusing earlier loads."""
+    if not os.path.exists(input_stl):
+        raise GenerationError(f"Input STL file not found at '{input_stl}'")
+    key = _file_key(input_stl) + (heightmap_res,)
+    sole = _cache_get(_sole_cache, key)
+    if sole is not None:
+        return sole
+    ray_grid = load_ray_grid(input_stl)
+    mesh_saved = ray_grid is not None and 'vertices' in ray_grid
+    try:
+        # A saved ray grid carries the merged mesh it indexes. Otherwise binary STLs
+        # are memory-mapped and merged in numpy; anything else goes through trimesh.
+        if mesh_saved:
+            arrays = ray_grid.pop('vertices'), ray_grid.pop('faces')
+        else:
+            arrays = load_binary_stl(input_stl)
+        mesh = trimesh.Trimesh(*arrays, process=False) if arrays is not None else trimesh.load_mesh(input_stl)
+    except Exception as e:
+        raise GenerationError(f"Failed to load STL file '{input_stl}': {e}") from e
+    if ray_grid is not None and not mesh_saved:
+        # Grids saved before the mesh was stored with them get it now, so the next load skips the merge
+        try:
+            save_ray_grid(input_stl, ray_grid, mesh.vertices, mesh.faces)
+        except OSError as e:
+            print(f"⚠ Warning: Could not save ray grid for '{input_stl}': {e}", file=sys.stderr)
+    sole = {
+        'key': key,
+        'path': input_stl,
+        'mesh': mesh,
+        'top_z': mesh.bounds[1][2],
+        'ray_grid': ray_grid,
+        'heightmap_res': heightmap_res,
+        'heightmap': load_heightmap(input_stl, heightmap_res) if heightmap_res > 0 else None,
+        'bottom_heightmap': load_heightmap(input_stl, heightmap_res, 'bottom') if heightmap_res > 0 else None,
+        'base': None,
+        'preview': None,
+        'mappings': {},
+    }
+    _cache_put(_sole_cache, key, sole, SOLE_CACHE_SIZE)
+    return sole
+
+
+def derive_sole(base, scale):
+    """Scale a loaded sole in x/y to another size, built on first use and cached.
+
+    Only the scaled vertices are new: surface lookups map points back onto the
+    base sole and reuse its BVH and heightmap.
+    """
+    key = base['key'] + (tuple(scale),)
+    sole = _cache_get(_sole_cache, key)
+    if sole is not None:
+        return sole
+    mesh = trimesh.Trimesh(vertices=base['mesh'].vertices * np.asarray(scale), faces=base['mesh'].faces, process=False)
+    sole = {
+        'key': key,
+        'path': base['path'],
+        'mesh': mesh,
+        'top_z': base['top_z'],
+        'ray_grid': None,
+        'heightmap_res': base['heightmap_res'],
+        'heightmap': None,
+        'bottom_heightmap': None,
+        'base': base,
+        'scale': np.asarray(scale),
+        'preview': None,
+        'mappings': {},
+    }
+    _cache_put(_sole_cache, key, sole, SOLE_CACHE_SIZE)
+    return sole
+
+
+def get_sole(params):
+    """Return the sole for resolved params, deriving it from the base sole for scaled sizes."""
+    sole = load_sole(params['input'], params['heightmap_res'])
+    if params['scale'] is None:
+        return sole
+    return derive_sole(sole, params['scale'])
+
+
+def sole_base_mesh(sole, lod):
+    """Base sole (vertices, faces) for a level of detail; the preview is decimated once per sole."""
+    mesh = sole['mesh']
+    if lod != 'preview':
+        return mesh.vertices, mesh.faces
+    if sole['preview'] is None:
+        sole['preview'] = cluster_decimate(mesh.vertices, mesh.faces, preview_cell_size(mesh.vertices))
+    return sole['preview']
+
+
+def load_annotations(annotation_path):
+    """Load a COCO zone file's compiled pack and index its categories, reusing earlier loads.
+
+    The pack is compiled and saved next to the zone file on first use.
+    """
+    if not os.path.exists(annotation_path):
+        raise GenerationError(f"Annotation file not found for selected foot: {annotation_path}")
+    key = _file_key(annotation_path)
+    annotations = _annotation_cache.get(key)
+    if annotations is not None:
+        return annotations
+    try:
+        pack = get_annotation_pack(annotation_path)
+    except Exception as e:
+        raise GenerationError(f"Failed to load annotation file '{annotation_path}': {e}") from e
+
+    category_ids = pack['category_ids'].tolist()
+    category_names = [name.lower() for name in pack['category_names']]
+    zone_name_to_ids = {}
+    for zone_id, zone_name in zip(category_ids, category_names):
+        zone_name_to_ids.setdefault(zone_name, []).append(zone_id)
+    img_width, img_height = pack['image_size']
+    annotations = {
+        'path': annotation_path,
+        'pack': pack,
+        'img_width': img_width,
+        'img_height': img_height,
+        'zone_name_to_ids': zone_name_to_ids,
+        'category_names': dict(zip(category_ids, category_names)),
+    }
+    _annotation_cache[key] = annotations
+    return annotations
+
+
+def build_ray_grid_cache(sole):
+    """Build the ray grid for a loaded sole, attach it and persist it with the merged mesh next to the STL."""
+    sole['ray_grid'] = build_ray_grid(sole['mesh'].vertices, sole['mesh'].faces)
+    try:
+        save_ray_grid(sole['path'], sole['ray_grid'], sole['mesh'].vertices, sole['mesh'].faces)
+    except OSError as e:
+        print(f"⚠ Warning: Could not save ray grid for '{sole['path']}': {e}", file=sys.stderr)
+    return sole['ray_grid']
+
+
+def build_heightmap_cache(sole, surface='top'):
+    """Build and persist the top (or bottom) surface heightmap for a loaded sole, and attach it."""
+    key = 'heightmap' if surface == 'top' else f"{surface}_heightmap"
+    grid = sole['ray_grid'] or build_ray_grid_cache(sole)
+    mesh = sole['mesh']
+    save_heightmap(sole['path'], mesh, sole['heightmap_res'], surface,
+                   lambda x, y, side: vertical_hits(grid, mesh.vertices, mesh.faces, x, y, side))
+    sole[key] = load_heightmap(sole['path'], sole['heightmap_res'], surface)
+    return sole[key]
+
+
+def build_heightfield(sole, centers, colors, params):
+    """Displace the sole's top heightmap by every bump and close it against the bottom into one solid.
+
+    Derived sizes use their base sole's heightmaps on a scaled grid. Returns
+    (vertices, faces, vertex_colors); top vertices raised by a bump take its color.
+    """
+    loaded = sole['base'] or sole
+    top = loaded['heightmap'] or build_heightmap_cache(loaded)
+    bottom = loaded['bottom_heightmap'] or build_heightmap_cache(loaded, 'bottom')
+    if top['heights'].shape != bottom['heights'].shape or top['origin'] != bottom['origin']:
+        raise GenerationError(f"Top and bottom heightmaps of '{loaded['path']}' do not share a grid.")
+    ny, nx = top['heights'].shape
+    xs = top['origin'][0] + np.arange(nx) * top['resolution']
+    ys = top['origin'][1] + np.arange(ny) * top['resolution']
+    if sole['base'] is not None:
+        xs, ys = xs * sole['scale'][0], ys * sole['scale'][1]
+    field, owner = displacement_field(xs, ys, centers, params['bump_radius'], params['bump_height'])
+    vertices, faces, top_nodes = heightfield_solid(xs, ys, np.asarray(top['heights']) + field, bottom['heights'],
+                                                   params['heightfield_tolerance'])
+    vertex_colors = np.empty((len(vertices), 4), dtype=np.uint8)
+    vertex_colors[:] = SOLE_COLOR
+    node_owner = owner.ravel()[top_nodes]
+    raised = node_owner != NO_BUMP
+    vertex_colors[np.flatnonzero(raised)] = colors[node_owner[raised]]
+    return vertices, faces, vertex_colors
+
+
+def warm_up(foot, params=None):
+    """Load a foot's sole, annotations, ray accelerator and heightmap ahead of requests.
+
+    Also builds and loads the foot's zone blocks when zone_blocks_dir is set.
+    """
+    params = resolve_params(foot, params)
+    sole = get_sole(params)
+    load_annotations(params['annotations'])
+    loaded = sole['base'] or sole  # derived sizes share the base sole's ray grid and heightmap
+    if loaded['ray_grid'] is None:
+        build_ray_grid_cache(loaded)
+    if loaded['heightmap'] is None and params['heightmap_res'] > 0:
+        build_heightmap_cache(loaded)
+    sole_base_mesh(sole, params['lod'])
+    if params['engine'] == 'heightfield' and loaded['bottom_heightmap'] is None:
+        build_heightmap_cache(loaded, 'bottom')
+    if params['zone_blocks_dir']:
+        get_zone_blocks(foot, params, build=True)
+    return sole
+
+
+def init_worker(warm_params, progress_queue=None):
+    """Process-pool initializer: load the assets of every (foot, params) pair once per worker process.
+
+    When progress_queue is given, run_job() puts (job_id, progress) tuples on it.
+    """
+    global _progress_queue
+    _progress_queue = progress_queue
+    for foot, params in warm_params:
+        try:
+            warm_up(foot, params)
+        except GenerationError as e:
+            print(f"⚠ Warning: Could not preload assets for {foot} foot: {e}", file=sys.stderr)
+
+
+def coordinate_mapping(bounds, img_width, img_height):
+    """Return the image-to-sole mapping for a mesh's bounds."""
+    return {
+        'origin_x': bounds[0][0] + 10,
+        'origin_y': bounds[0][1] + 10,
+        'x_scale': (bounds[1][0] - bounds[0][0]) / img_width,
+        'y_scale': (bounds[1][1] - bounds[0][1]) / img_height,
+        'img_height': img_height,
+    }
+
+
+def sole_mapping(sole, annotations):
+    """Image-to-sole mapping for a loaded sole, computed once per image size."""
+    key = (annotations['img_width'], annotations['img_height'])
+    if key not in sole['mappings']:
+        sole['mappings'][key] = coordinate_mapping(sole['mesh'].bounds, *key)
+    return sole['mappings'][key]
+
+
+def map_2d_to_3d(mapping, x, y):
+    x3d = mapping['origin_x'] + x * mapping['x_scale']
+    y3d = mapping['origin_y'] + (mapping['img_height'] - y) * mapping['y_scale']
+    return x3d, y3d
+
+
+def map_3d_to_2d(mapping, x, y):
+    x2d = (x - mapping['origin_x']) / mapping['x_scale']
+    y2d = mapping['img_height'] - (y - mapping['origin_y']) / mapping['y_scale']
+    return x2d, y2d
+
+
+def sole_bounds(params):
+    """Bounds of the sole for resolved params without loading it as a mesh, cached per file and size.
+
+    Binary STLs only have their facet corners scanned; the result equals the
+    loaded (and, for derived sizes, scaled) mesh's bounds.
+    """
+    if not os.path.exists(params['input']):
+        raise GenerationError(f"Input STL file not found at '{params['input']}'")
+    scale = None if params['scale'] is None else tuple(params['scale'])
+    key = _file_key(params['input']) + (scale,)
+    bounds = _sole_bounds_cache.get(key)
+    if bounds is None:
+        try:
+            facets = mmap_binary_stl(params['input'])
+            if facets is not None and len(facets):
+                corners = facets['vertices'].reshape(-1, 3)
+                bounds = np.array([corners.min(axis=0), corners.max(axis=0)], dtype=np.float64)
+            else:
+                bounds = trimesh.load_mesh(params['input']).bounds
+        except Exception as e:
+            raise GenerationError(f"Failed to load STL file '{params['input']}': {e}") from e
+        if scale is not None:
+            bounds = bounds * np.asarray(scale)
+        _sole_bounds_cache[key] = bounds
+    return bounds
+
+
+def zone_names_at(foot, points, params=None):
+    """Name of the reflexology zone under each 3D sole point, None where there is none.
+
+    Points are (x, y, z) in the coordinates of the generated sole for the
+    params' size; they are projected straight down onto the zone image, so z
+    is ignored.
+    """
+    foot = foot.lower()
+    if foot not in FEET:
+        raise GenerationError(f"Unknown foot '{foot}'.")
+    params = resolve_params(foot, params)
+    annotations = load_annotations(params['annotations'])
+    mapping = coordinate_mapping(sole_bounds(params), annotations['img_width'], annotations['img_height'])
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    x2d, y2d = map_3d_to_2d(mapping, points[:, 0], points[:, 1])
+    category_names = annotations['category_names']
+    return [category_names.get(zone_id) for zone_id in zones_at(annotations['pack'], x2d, y2d).tolist()]
+
+
+def resolve_zones(annotations, zones, warnings):
+    """Map zone names to category ids; an empty selection means every annotated zone."""
+    selected_ids = []
+    for zone in (zone.lower() for zone in zones):
+        if zone in annotations['zone_name_to_ids']:
+            selected_ids.extend(annotations['zone_name_to_ids'][zone])
+        else:
+            warnings.append(f"Zone '{zone}' not found in annotations.")
+    if not selected_ids and zones:
+        raise GenerationError("None of the selected zones matched known categories.")
+    return selected_ids or annotations['pack']['annotation_categories'].tolist()
+
+
+def sample_candidates(annotations, sample_ids, step, owner_rule='smallest'):
+    """Return candidate (x2d, y2d) image points, their category ids, owning polygon areas and the label raster."""
+    label_raster, area_raster = compile_label_raster(annotations['pack'], set(sample_ids), return_areas=True,
+                                                     owner_rule=owner_rule, category_order=selection_ranks(sample_ids))
+    candidate_x, candidate_y, candidate_ids = sample_label_grid(label_raster, sample_ids, step)
+    candidate_areas = area_raster[candidate_y.astype(np.intp), candidate_x.astype(np.intp)]
+    return np.column_stack((candidate_x, candidate_y)), candidate_ids, candidate_areas, label_raster
+
+
+def lookup_surface(sole, x3d, y3d, profile=None):
+    """Top-surface hit (x, y, z) for every point; z is NaN where the sole is missed.
+
+    Uses the cached heightmap when present and exact ray casting for the rest,
+    through the sole's ray grid when it has one and its BVH otherwise.
+    profile, if given, counts heightmap hits and ray attempts/hits.
+    """
+    if sole['base'] is not None:
+        # A derived sole is its base scaled in x/y, so vertical rays map straight onto the base.
+        scale = sole['scale']
+        hit_xy, hit_z = lookup_surface(sole['base'], np.asarray(x3d) / scale[0], np.asarray(y3d) / scale[1], profile)
+        return hit_xy * scale[:2], hit_z
+    count = len(x3d)
+    hit_z = np.full(count, np.nan)
+    hit_xy = np.zeros((count, 2))
+    ray_mask = np.ones(count, dtype=bool)
+    if sole['heightmap'] is not None and count > 0:
+        hit_z[:] = sample_heightmap(sole['heightmap'], x3d, y3d)
+        hit_xy[:] = np.column_stack((x3d, y3d))
+        # Points near the sole outline, where the grid has no full cell, are cast exactly.
+        ray_mask = np.isnan(hit_z)
+    ray_index = np.flatnonzero(ray_mask)
+    if len(ray_index) > 0 and sole['ray_grid'] is not None:
+        mesh = sole['mesh']
+        hit_z[ray_index] = vertical_hits(sole['ray_grid'], mesh.vertices, mesh.faces, x3d[ray_index], y3d[ray_index])
+        hit_xy[ray_index] = np.column_stack((x3d[ray_index], y3d[ray_index]))
+    elif len(ray_index) > 0:
+        ray_origins = np.column_stack((x3d[ray_index], y3d[ray_index], np.full(len(ray_index), sole['top_z'] + 10)))
+        ray_directions = np.tile([0.0, 0.0, -1.0], (len(ray_index), 1))
+        # Downward rays from above the sole: the first hit along each ray is the top surface.
+        locations, index_ray, _ = sole['mesh'].ray.intersects_location(ray_origins, ray_directions, multiple_hits=False)
+        hit_z[ray_index[index_ray]] = locations[:, 2]
+        hit_xy[ray_index[index_ray]] = locations[:, :2]
+    if profile is not None:
+        profile.count('heightmap_hits', count - len(ray_index))
+        profile.count('ray_attempts', len(ray_index))
+        profile.count('ray_hits', int(np.count_nonzero(~np.isnan(hit_z[ray_index]))))
+    return hit_xy, hit_z
+
+
+def zone_colors_for(bump_ids, category_names):
+    """Return one RGBA row per bump from its zone's color."""
+    colors = np.array([ZONE_COLOR_MAP["default"]], dtype=np.uint8).repeat(len(bump_ids), axis=0)
+    for zone_id in np.unique(bump_ids):
+        colors[bump_ids == zone_id] = ZONE_COLOR_MAP.get(category_names[zone_id], ZONE_COLOR_MAP["default"])
+    return colors
+
+
+def instance_palette(bump_ids, category_names):
+    """Return (palette_index, palette): one {name, color} entry per zone and each bump's entry."""
+    palette = []
+    palette_positions = {}
+    palette_index = np.zeros(len(bump_ids), dtype=np.uint8)
+    for zone_id in np.unique(bump_ids):
+        zone_name = category_names.get(zone_id, "default")
+        if zone_name not in palette_positions:
+            palette_positions[zone_name] = len(palette)
+            palette.append({'name': zone_name, 'color': ZONE_COLOR_MAP.get(zone_name, ZONE_COLOR_MAP["default"])})
+        palette_index[bump_ids == zone_id] = palette_positions[zone_name]
+    return palette_index, palette
+
+
+def compute_metrics(mode, attempts, surface_hits, positional_errors, bump_locations, mapping, label_raster, zone_paths,
+                    step):
+    """Return the quantitative placement metrics, or None when mode is 'off'.
+
+    success_rate is the share of attempts that hit the sole surface; bumps
+    dropped afterwards for spacing are counted in bumps_dropped_spacing.
+    """
+    if mode == 'off':
+        return None
+    spike_count = len(bump_locations)
+    bump_spacing = nearest_neighbor_spacing(bump_locations)
+    placement_accuracy = 0
+    if spike_count > 0:
+        points_2d = np.column_stack(map_3d_to_2d(mapping, bump_locations[:, 0], bump_locations[:, 1]))
+        if mode == 'fast':
+            correct = zone_hits_fast(points_2d, label_raster)
+        else:
+            correct = zone_hits_full(points_2d, zone_paths)
+        placement_accuracy = np.count_nonzero(correct) / spike_count * 100
+    return {
+        'success_rate': (surface_hits / attempts * 100) if attempts > 0 else 0,
+        'mean_positional_error': float(np.mean(positional_errors)) if len(positional_errors) else 0,
+        'std_positional_error': float(np.std(positional_errors)) if len(positional_errors) else 0,
+        'mapping_accuracy': float(placement_accuracy),
+        'avg_spacing': float(np.mean(bump_spacing)) if len(bump_spacing) else step,
+        'std_spacing': float(np.std(bump_spacing)) if len(bump_spacing) else 0,
+    }
+
+
+def zone_blocks_directory(foot, params):
+    """Directory holding a foot's zone blocks for the given inputs and geometry parameters."""
+    payload = {
+        'generator_version': GENERATOR_VERSION,
+        'foot': foot,
+        'params': {key: params[key] for key in GEOMETRY_PARAMS},
+        'input_sha256': cached_file_sha256(params['input']),
+        'annotations_sha256': cached_file_sha256(params['annotations']),
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+    return os.path.join(params['zone_blocks_dir'], f"{foot}_{digest[:16]}")
+
+
+def build_zone_blocks(foot, params=None):
+    """Precompute every annotated zone's bumps as its own block and persist them.
+
+    Each zone is sampled on its own, so a block holds all of the zone's bumps;
+    overlaps between zones are settled when blocks are composed.
+    """
+    params = resolve_params(foot, params)
+    sole = get_sole(params)
+    annotations = load_annotations(params['annotations'])
+    directory = zone_blocks_directory(foot, params)
+    if os.path.exists(os.path.join(directory, 'manifest.json')):
+        return directory
+    mapping = sole_mapping(sole, annotations)
+    step = params['step']
+
+    zone_ids = list(dict.fromkeys(annotations['pack']['annotation_categories'].tolist()))
+    samples = []
+    for zone_id in zone_ids:
+        labels, areas = compile_label_raster(annotations['pack'], {zone_id}, return_areas=True)
+        x, y, _ = sample_label_grid(labels, [zone_id], step)
+        priority = areas[y.astype(np.intp), x.astype(np.intp)]
+        samples.append((x, y, priority))
+
+    # One surface lookup for every zone's points together
+    all_x = np.concatenate([x for x, _, _ in samples])
+    all_y = np.concatenate([y for _, y, _ in samples])
+    x3d, y3d = map_2d_to_3d(mapping, all_x, all_y)
+    _, hit_z = lookup_surface(sole, x3d, y3d)
+
+    template_vertices, template_faces = create_ellipsoid_template(
+        params['bump_radius'], params['bump_radius'], params['bump_height'],
+        params['bump_sections'], params['bump_stacks'])
+    base_vertices, base_faces = sole_base_mesh(sole, params['lod'])
+    arrays = {
+        'base_vertices': np.asarray(base_vertices, dtype=np.float32),
+        'base_faces': np.asarray(base_faces, dtype=np.int32),
+        'template_faces': template_faces.astype(np.int32),
+    }
+    manifest = {
+        'generator_version': GENERATOR_VERSION,
+        'foot': foot,
+        'params': {key: params[key] for key in GEOMETRY_PARAMS},
+        'template_vertex_count': len(template_vertices),
+        'zones': {},
+    }
+    start = 0
+    for zone_id, (x, y, priority) in zip(zone_ids, samples):
+        end = start + len(x)
+        hit = ~np.isnan(hit_z[start:end])
+        centers = np.column_stack((x3d[start:end][hit], y3d[start:end][hit], hit_z[start:end][hit] + 0.01))
+        zone_name = annotations['category_names'].get(zone_id, '')
+        arrays[f"zone_{zone_id}_vertices"] = (template_vertices[np.newaxis] + centers[:, np.newaxis]).reshape(-1, 3).astype(np.float32)
+        arrays[f"zone_{zone_id}_centers"] = centers
+        arrays[f"zone_{zone_id}_cells"] = grid_cells(x[hit], y[hit], annotations['img_width'], step)
+        arrays[f"zone_{zone_id}_priority"] = priority[hit]
+        manifest['zones'][str(zone_id)] = {
+            'name': zone_name,
+            'color': ZONE_COLOR_MAP.get(zone_name, ZONE_COLOR_MAP["default"]),
+            'count': int(np.count_nonzero(hit)),
+        }
+        start = end
+    save_zone_blocks(directory, manifest, arrays)
+    # Blocks of older generator versions are unreachable now that their directory names changed
+    prune_zone_blocks(params['zone_blocks_dir'], f"{foot}_", GENERATOR_VERSION)
+    return directory
+
+
+def get_zone_blocks(foot, params, build=False):
+    """Return the loaded zone blocks for a foot, building them first if asked."""
+    directory = zone_blocks_directory(foot, params)
+    blocks = _cache_get(_zone_block_cache, directory)
+    if blocks is None:
+        blocks = load_zone_blocks(directory)
+        if blocks is None and build:
+            build_zone_blocks(foot, params)
+            blocks = load_zone_blocks(directory)
+        if blocks is not None:
+            _cache_put(_zone_block_cache, directory, blocks, ZONE_BLOCK_CACHE_SIZE)
+    return blocks
+
+
+def generate_from_blocks(foot, zones, params, blocks, progress=None, profile=None):
+    """Serve a request by composing precomputed zone blocks; no sampling or ray casting."""
+    start_time = time.time()
+    profile = profile or Profile()
+    warnings = []
+    with profile.span('annotation_load'):
+        annotations = load_annotations(params['annotations'])
+    zone_ids = resolve_zones(annotations, zones, warnings)
+    _report(progress, 'compose')
+    with profile.span('compose'):
+        vertices, faces, vertex_colors, bump_counts, centers, center_ids = compose_zone_blocks(
+            blocks, zone_ids, SOLE_COLOR, params['overlap_rule'], params['min_spacing'])
+    zone_bumps = {}
+    for zone_id in dict.fromkeys(zone_ids):
+        zone_name = annotations['category_names'].get(zone_id)
+        if not zone_name:
+            continue
+        if bump_counts.get(zone_id, 0) == 0:
+            warnings.append(f"No valid points found for zone '{zone_name}'.")
+            continue
+        zone_bumps[zone_name] = zone_bumps.get(zone_name, 0) + bump_counts[zone_id]
+    bump_count = sum(bump_counts.values())
+    _report(progress, 'bumps', bumps_placed=bump_count)
+    template_vertices, template_faces = create_ellipsoid_template(
+        params['bump_radius'], params['bump_radius'], params['bump_height'],
+        params['bump_sections'], params['bump_stacks'])
+    palette_index, palette = instance_palette(center_ids, annotations['category_names'])
+    _count_geometry(profile, faces, vertices, zone_bumps)
+    return {
+        'foot': foot,
+        'vertices': vertices,
+        'faces': faces,
+        'vertex_colors': vertex_colors,
+        'instances': {
+            'base_vertices': blocks['base_vertices'],
+            'base_faces': blocks['base_faces'],
+            'template_vertices': template_vertices,
+            'template_faces': template_faces,
+            'centers': centers,
+            'palette_index': palette_index,
+            'palette': palette,
+        },
+        'bump_count': bump_count,
+        'zone_bumps': zone_bumps,
+        'zone_colors': {zone: ZONE_COLOR_MAP.get(zone, ZONE_COLOR_MAP["default"]) for zone in zone_bumps},
+        'metrics': None,
+        'warnings': warnings,
+        'elapsed': time.time() - start_time,
+        'profile': profile.record(),
+    }
+
+
+def _count_geometry(profile, faces, vertices, zone_bumps):
+    profile.count('triangles', len(faces))
+    profile.count('vertices', len(vertices))
+    for zone_name, count in zone_bumps.items():
+        profile.count('bumps', count, zone=zone_name)
+
+
+def _report(progress, stage, **fields):
+    if progress is not None:
+        progress(stage, **fields)
+
+
+def generate(foot, zones, params=None, progress=None, profile=None):
+    """Generate a sole with pressure bumps for the selected reflexology zones.
+
+    Returns a dict with the combined 'vertices', 'faces' and 'vertex_colors'
+    arrays, the same geometry as 'instances' (base sole, one bump template,
+    bump centers and a per-zone palette) and placement statistics. With the
+    heightfield engine the bumps are part of a single base mesh and there are
+    no instances. Raises GenerationError on bad inputs.
+    progress, if given, is called as progress(stage, **fields) between stages.
+    Stage timings and counters go to profile (a profiling.Profile, created when
+    not given) and are returned as the result's 'profile' record.
+    """
+    profile = profile or Profile()
+    foot = foot.lower()
+    if foot not in FEET:
+        raise GenerationError(f"Unknown foot '{foot}'.")
+    params = resolve_params(foot, params)
+    if params['zone_blocks_dir'] and params['metrics'] == 'off' and params['engine'] == 'instanced':
+        blocks = get_zone_blocks(foot, params, build=True)
+        if blocks is not None:
+            return generate_from_blocks(foot, zones, params, blocks, progress, profile)
+    _report(progress, 'loading')
+    with profile.span('stl_load'):
+        sole = get_sole(params)
+    with profile.span('annotation_load'):
+        annotations = load_annotations(params['annotations'])
+
+    _report(progress, 'sampling')
+    start_time = time.time()
+    warnings = []
+    category_names = annotations['category_names']
+    mapping = sole_mapping(sole, annotations)
+
+    # --- Sample Candidate Points For All Selected Zones ---
+    with profile.span('sampling'):
+        sample_ids = resolve_zones(annotations, zones, warnings)
+        zone_paths = {}
+        pack = annotations['pack']
+        for index, zone_id in enumerate(pack['annotation_categories'].tolist()):
+            if zone_id not in sample_ids:
+                continue
+            zone_name = category_names.get(zone_id)
+            if not zone_name:
+                warnings.append(f"No category found for annotation ID {pack['annotation_ids'][index]}.")
+                continue
+            zone_paths.setdefault(zone_name, []).append(Path(annotation_polygon(pack, index)))
+        try:
+            candidate_points, candidate_ids, candidate_areas, label_raster = sample_candidates(
+                annotations, sample_ids, params['step'], params['overlap_rule'])
+        except Exception as e:
+            raise GenerationError(f"Failed to rasterize zones from '{annotations['path']}': {e}") from e
+        sampled_ids = set(np.unique(candidate_ids).tolist())
+        for zone_id in dict.fromkeys(sample_ids):
+            if zone_id in category_names and zone_id not in sampled_ids:
+                warnings.append(f"No valid points found for zone '{category_names[zone_id]}'.")
+
+    # --- Surface Lookup ---
+    _report(progress, 'surface', candidates=len(candidate_points))
+    profile.count('candidates', len(candidate_points))
+    with profile.span('surface_lookup'):
+        x3d, y3d = map_2d_to_3d(mapping, candidate_points[:, 0], candidate_points[:, 1])
+        hit_xy, hit_z = lookup_surface(sole, x3d, y3d, profile)
+
+    # --- Build Bumps At Every Hit ---
+    with profile.span('bump_build'):
+        hit_index = np.flatnonzero(~np.isnan(hit_z))
+        surface_hits = len(hit_index)
+        if params['min_spacing'] > 0:
+            # Across zones, a bump too close to a stronger claim is dropped
+            order = ownership_order(params['overlap_rule'], candidate_ids[hit_index], candidate_areas[hit_index],
+                                    selection_ranks(sample_ids))
+            spaced = enforce_min_spacing(np.column_stack((x3d[hit_index], y3d[hit_index])), params['min_spacing'], order)
+            profile.count('bumps_dropped_spacing', int(len(spaced) - spaced.sum()))
+            hit_index = hit_index[spaced]
+        bump_locations = np.column_stack((hit_xy[hit_index], hit_z[hit_index]))
+        # Correct positional error with scaled coordinates
+        positional_errors = np.linalg.norm(bump_locations[:, :2] - np.column_stack((x3d[hit_index], y3d[hit_index])), axis=1)
+        bump_ids = candidate_ids[hit_index]
+        zone_bumps = {}
+        for zone_id, count in zip(*np.unique(bump_ids, return_counts=True)):
+            zone_name = category_names[zone_id]
+            zone_bumps[zone_name] = zone_bumps.get(zone_name, 0) + int(count)
+        template = create_ellipsoid_template(params['bump_radius'], params['bump_radius'], params['bump_height'],
+                                             params['bump_sections'], params['bump_stacks'])
+        bump_centers = np.column_stack((x3d[hit_index], y3d[hit_index], hit_z[hit_index] + 0.01))
+        bump_colors = zone_colors_for(bump_ids, category_names)
+        palette_index, palette = instance_palette(bump_ids, category_names)
+    instances = {
+        'template_vertices': template[0],
+        'template_faces': template[1],
+        'centers': bump_centers,
+        'palette_index': palette_index,
+        'palette': palette,
+    }
+    if params['engine'] == 'heightfield':
+        with profile.span('heightfield'):
+            vertices, faces, vertex_colors = build_heightfield(sole, bump_centers, bump_colors, params)
+        # The bumps are part of the solid, so the viewer gets it as the base with no instances.
+        instances.update(base_vertices=vertices, base_faces=faces, centers=np.empty((0, 3)),
+                         palette_index=np.empty(0, dtype=np.uint8))
+    else:
+        with profile.span('concatenate'):
+            base_vertices, base_faces = sole_base_mesh(sole, params['lod'])
+            vertices, faces, vertex_colors = assemble_instances(
+                base_vertices, base_faces, SOLE_COLOR, template, bump_centers, bump_colors)
+        instances.update(base_vertices=base_vertices, base_faces=base_faces)
+
+    _report(progress, 'bumps', bumps_placed=len(hit_index))
+
+    metrics = None
+    if params['metrics'] != 'off':
+        _report(progress, 'metrics', bumps_placed=len(hit_index))
+        with profile.span('metrics'):
+            metrics = compute_metrics(params['metrics'], len(candidate_points), surface_hits, positional_errors,
+                                      bump_locations, mapping, label_raster, zone_paths, params['step'])
+    _count_geometry(profile, faces, vertices, zone_bumps)
+    return {
+        'foot': foot,
+        'vertices': vertices,
+        'faces': faces,
+        'vertex_colors': vertex_colors,
+        'instances': instances,
+        'bump_count': len(hit_index),
+        'zone_bumps': {zone: count for zone, count in zone_bumps.items() if count > 0},
+        'zone_colors': {zone: ZONE_COLOR_MAP.get(zone, ZONE_COLOR_MAP["default"]) for zone in zone_bumps},
+        'metrics': metrics,
+        'warnings': warnings,
+        'elapsed': time.time() - start_time,
+        'profile': profile.record(),
+    }
+
+
+def export_result(result, output_file, formats=EXPORT_FORMATS, profile=None):
+    """Write a generated result in the requested formats next to output_file.
+
+    PLY carries the vertex colors; 'wmesh' writes the compact web-viewer format
+    with its precompressed variants. Returns {format: path} for every file written.
+    profile, if given, gets an 'export' span and bytes written per format.
+    """
+    profile = profile or Profile()
+    with profile.span('export'):
+        paths = output_paths(output_file, formats)
+        web_path = paths.pop(WEB_MESH_FORMAT, None)
+        outputs = write_mesh(paths, result['vertices'], result['faces'], result['vertex_colors']) if paths else {}
+        if web_path is not None:
+            outputs.update(write_web_mesh(web_path, result['instances'], SOLE_COLOR))
+    for fmt, path in outputs.items():
+        profile.count('bytes_written', os.path.getsize(path), format=fmt)
+    return outputs
+
+
+def run_job(foot, zones, params, output_file, job_id=None, formats=EXPORT_FORMATS, cprofile_path=None):
+    """Generate and export in one call, returning only the small summary fields.
+
+    Used by worker processes so that mesh buffers never cross process
+    boundaries. Progress is forwarded to the pool's progress queue under job_id.
+    The summary's 'profile' record covers generation and export; with
+    cprofile_path set, the whole job also runs under cProfile and is dumped there.
+    """
+    def forward_progress(stage, **fields):
+        _progress_queue.put((job_id, dict(fields, stage=stage)))
+
+    progress = forward_progress if _progress_queue is not None and job_id is not None else None
+    profile = Profile()
+    with cprofiled(cprofile_path):
+        result = generate(foot, zones, params, progress, profile)
+        _report(progress, 'export', bumps_placed=result['bump_count'])
+        outputs = export_result(result, output_file, formats, profile)
+    summary = {key: value for key, value in result.items() if key not in ('vertices', 'faces', 'vertex_colors', 'instances')}
+    summary.update({'output': outputs.get('ply'), 'stl_output': outputs.get('stl'), 'outputs': outputs,
+                    'profile': profile.record()})
+    return summary
@@ -0,0 +1,43 @@
+import math
+import os
+import re
+
+BASE_UK_SIZE = 8
+MIN_UK_SIZE = 3
+MAX_UK_SIZE = 15
+# UK sizes are one barleycorn (1/3 inch) apart and a size-N last is N + 25 barleycorns long.
+LAST_LENGTH_OFFSET = 25
+# Sole width grades at roughly two thirds of the relative rate of its length.
+WIDTH_GRADING = 2 / 3
+
+_SIZE_IN_NAME = re.compile(r'_UK_\d+(?:\.5)?_')
+
+
+def parse_uk_size(value):
+    """Return a UK size as a float, accepting whole and half sizes in the supported range."""
+    try:
+        size = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid UK size '{value}'.")
+    if not math.isfinite(size) or size * 2 != int(size * 2) or not MIN_UK_SIZE <= size <= MAX_UK_SIZE:
+        raise ValueError(f"UK size must be a whole or half size from {MIN_UK_SIZE} to {MAX_UK_SIZE}.")
+    return size
+
+
+def size_scale(size, base_size=BASE_UK_SIZE):
+    """(x, y, z) scale that turns a base-size sole into the given size.
+
+    Length runs along y; the sole keeps its thickness.
+    """
+    length_ratio = (size + LAST_LENGTH_OFFSET) / (base_size + LAST_LENGTH_OFFSET)
+    width_ratio = 1 + (length_ratio - 1) * WIDTH_GRADING
+    return (width_ratio, length_ratio, 1.0)
+
+
+def sized_input_path(input_stl, size):
+    """Path of a dedicated STL for size next to input_stl (Shoe_Sole_UK_<size>_<Foot>.stl), if it exists."""
+    directory, name = os.path.split(input_stl)
+    if not _SIZE_IN_NAME.search(name):
+        return None
+    candidate = os.path.join(directory, _SIZE_IN_NAME.sub(f"_UK_{size:g}_", name, count=1))
+    return candidate if os.path.exists(candidate) else None
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+STL_HEADER_BYTES = 80
+# One binary STL facet: normal, three corners and the attribute byte count.
+STL_FACET_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attributes', '<u2')])
+
+
+def mmap_binary_stl(path):
+    """Memory-map the facets of a binary STL as a structured array; None for ASCII or malformed files.
+
+    Nothing is read until the facets are used, and then only the touched pages.
+    """
+    size = os.path.getsize(path)
+    if size < STL_HEADER_BYTES + 4:
+        return None
+    count = int(np.fromfile(path, dtype='<u4', count=1, offset=STL_HEADER_BYTES)[0])
+    if size != STL_HEADER_BYTES + 4 + count * STL_FACET_DTYPE.itemsize:
+        return None
+    if count == 0:
+        return np.zeros(0, dtype=STL_FACET_DTYPE)
+    return np.memmap(path, dtype=STL_FACET_DTYPE, mode='r', offset=STL_HEADER_BYTES + 4, shape=(count,))
+
+
+def load_binary_stl(path):
+    """Read a binary STL into (vertices, faces) with identical corners merged; None if it is not binary.
+
+    Corners are merged on their exact float32 values and numbered in order of
+    first appearance, which matches what trimesh.load_mesh produces.
+    """
+    facets = mmap_binary_stl(path)
+    if facets is None:
+        return None
+    # np.array always copies, so the read-only map is never written; + 0 in place turns -0.0 into 0.0 so both merge
+    corners = np.array(facets['vertices'], dtype=np.float32, order='C').reshape(-1, 3)
+    corners += np.float32(0)
+    del facets
+    keys = corners.view(np.dtype((np.void, corners.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    number = np.empty_like(order)
+    number[order] = np.arange(len(order))
+    vertices = corners[first[order]].astype(np.float64)
+    faces = number[inverse.ravel()].reshape(-1, 3)
+    return vertices, faces
@@ -1,8 +1,17 @@
 
-import trimesh
 import numpy as np
 import json
 
+import slipper_engine
+from ray_grid import vertical_hits
+
+
+def load_sole(stl_path):
+    """Load a sole through the engine, which reuses the merged mesh saved with its ray grid, building the grid once."""
+    sole = slipper_engine.load_sole(stl_path)
+    grid = sole['ray_grid'] or slipper_engine.build_ray_grid_cache(sole)
+    return sole['mesh'], grid
+
 
 def load_coco_annotations(json_path):
     """Load COCO annotations for reflexology zones."""
@@ -16,7 +25,7 @@ def load_coco_annotations(json_path):
     return polygons, coco_data['images'][0]['width'], coco_data['images'][0]['height']
 
 
-def ray_casting(mesh, points_2d, img_width, img_height):
+def ray_casting(mesh, grid, points_2d, img_width, img_height):
     """Perform ray-casting to map 2D points to 3D mesh."""
     # Scale 2D points to 3D insole bounds
     bounds = mesh.bounds
@@ -35,10 +44,10 @@ def ray_casting(mesh, points_2d, img_width, img_height):
     ray_origins = np.array(ray_origins)
     ray_directions = np.array(ray_directions)
 
-    # Perform ray-casting
-    locations, index_ray, index_tri = mesh.ray.intersects_location(
-        ray_origins, ray_directions, multiple_hits=False
-    )
+    # Perform ray-casting: downward rays through the ray grid
+    hit_z = vertical_hits(grid, mesh.vertices, mesh.faces, ray_origins[:, 0], ray_origins[:, 1])
+    index_ray = np.flatnonzero(~np.isnan(hit_z))
+    locations = np.column_stack((ray_origins[index_ray, :2], hit_z[index_ray]))
 
     # Calculate metrics
     success_rate = len(locations) / len(ray_origins) * 100 if len(ray_origins) > 0 else 0
@@ -59,7 +68,7 @@ def main():
     stl_path = "Shoe_Sole_UK_8_Left.stl"
 
     # Load data
-    mesh = trimesh.load(stl_path)
+    mesh, grid = load_sole(stl_path)
     polygons, img_width, img_height = load_coco_annotations(json_path)
 
     # Process one zone (e.g., heart) for demo
@@ -69,7 +78,7 @@ def main():
         return
 
     # Use polygon vertices as 2D points for simplicity
-    locations, success_rate, mean_error = ray_casting(mesh, zone_points, img_width, img_height)
+    locations, success_rate, mean_error = ray_casting(mesh, grid, zone_points, img_width, img_height)
 
     # Output results
     print(f"Ray-Casting Success Rate: {success_rate:.2f}%")
@@ -0,0 +1,50 @@
+import json
+import shutil
+
+import numpy as np
+import pytest
+
+import slipper_engine
+from annotation_pack import compile_annotation_pack, get_annotation_pack, load_annotation_pack, zones_at
+from zone_raster import compile_label_raster
+
+
+@pytest.mark.parametrize('foot', ['left', 'right'])
+def test_zones_at_matches_the_label_raster(sole_inputs, foot):
+    pack = get_annotation_pack(sole_inputs[foot]['annotations'])
+    labels = compile_label_raster(pack)
+    rows, cols = np.mgrid[0:labels.shape[0], 0:labels.shape[1]]
+    zones = zones_at(pack, cols.ravel() + 0.5, rows.ravel() + 0.5)
+    assert np.array_equal(zones.reshape(labels.shape), labels)
+
+
+def test_zones_at_outside_the_image_is_no_zone(sole_inputs):
+    pack = get_annotation_pack(sole_inputs['left']['annotations'])
+    assert zones_at(pack, [-5.0, 1e6, np.nan, 10.0], [0.0, 0.0, 10.0, np.inf]).tolist() == [-1, -1, -1, -1]
+
+
+def test_saved_pack_is_reused_until_the_zone_file_changes(sole_inputs, tmp_path):
+    path = str(tmp_path / 'zones.json')
+    shutil.copyfile(sole_inputs['left']['annotations'], path)
+    with open(path) as f:
+        coco_data = json.load(f)
+    compiled = get_annotation_pack(path)
+    loaded = load_annotation_pack(path)
+    expected = compile_annotation_pack(coco_data)
+    for key, value in expected.items():
+        assert np.array_equal(loaded[key], value) and np.array_equal(compiled[key], value)
+
+    coco_data['categories'] = coco_data['categories'][:1]
+    with open(path, 'w') as f:
+        json.dump(coco_data, f)
+    assert load_annotation_pack(path) is None
+    assert len(get_annotation_pack(path)['category_names']) == 1
+
+
+@pytest.mark.parametrize('size', [None, 11])
+def test_bump_centers_map_back_to_their_zones(sole_inputs, size):
+    params = dict(sole_inputs['right'], metrics='off', size=size)
+    result = slipper_engine.generate('right', ['KIDNEY', 'HEART'], params)
+    names = slipper_engine.zone_names_at('right', result['instances']['centers'], params)
+    assert set(names) == {'kidney', 'heart'}
+    assert {name: names.count(name) for name in set(names)} == result['zone_bumps']
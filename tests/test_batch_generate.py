@@ -0,0 +1,19 @@
+import json
+
+import batch_generate
+
+
+def test_invalid_job_is_recorded_in_the_summary(sole_inputs, tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    defaults = dict(sole_inputs['left'], metrics='off', step=10.0)
+    jobs = [{'name': 'valid', 'foot': 'left'}, {'name': 'bad_size', 'foot': 'left', 'size': 99}]
+    manifest.write_text(json.dumps({'defaults': defaults, 'jobs': jobs}))
+    summary_path = tmp_path / 'summary.json'
+    exit_code = batch_generate.main([str(manifest), '--workers', '1', '--output-dir', str(tmp_path / 'out'),
+                                     '--summary', str(summary_path)])
+    assert exit_code == 1
+    summary = json.loads(summary_path.read_text())
+    assert (summary['succeeded'], summary['failed']) == (1, 1)
+    valid, bad = summary['records']
+    assert valid['name'] == 'valid' and valid['status'] == 'ok'
+    assert bad['name'] == 'bad_size' and bad['status'] == 'error' and 'size' in bad['error'].lower()
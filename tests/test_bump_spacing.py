@@ -0,0 +1,43 @@
+import numpy as np
+
+from bump_spacing import enforce_min_spacing
+from result_cache import result_cache_key
+
+
+def brute_force_spacing(points, min_distance, order):
+    kept = []
+    for i in order:
+        if all(np.hypot(*(points[i, :2] - points[j, :2])) >= min_distance for j in kept):
+            kept.append(i)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[kept] = True
+    return keep
+
+
+def test_enforce_min_spacing_matches_a_brute_force_greedy_pass():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-30, 30, (600, 3))
+    for min_distance in (0.5, 2.0, 7.5):
+        order = rng.permutation(len(points))
+        keep = enforce_min_spacing(points, min_distance, order)
+        assert np.array_equal(keep, brute_force_spacing(points, min_distance, order))
+        kept = points[keep, :2]
+        distances = np.hypot(*(kept[:, np.newaxis] - kept[np.newaxis]).transpose(2, 0, 1))
+        assert distances[~np.eye(len(kept), dtype=bool)].min() >= min_distance
+
+
+def test_enforce_min_spacing_keeps_everything_when_disabled():
+    points = np.zeros((5, 3))
+    assert enforce_min_spacing(points, 0).all()
+    assert enforce_min_spacing(np.zeros((0, 3)), 1.0).shape == (0,)
+
+
+def test_zone_order_is_part_of_the_cache_key_only_for_the_selection_rule(sole_inputs):
+    inputs = sole_inputs['left']
+
+    def key(zones, rule):
+        return result_cache_key('left', None, zones, {'overlap_rule': rule}, inputs['input'], inputs['annotations'])
+
+    assert key(['KIDNEY', 'LIVER'], 'smallest') == key(['liver', 'kidney', 'LIVER'], 'smallest')
+    assert key(['KIDNEY', 'LIVER'], 'selection') != key(['LIVER', 'KIDNEY'], 'selection')
+    assert key(['KIDNEY', 'LIVER'], 'selection') == key(['kidney', 'liver', 'KIDNEY'], 'selection')
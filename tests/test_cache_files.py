@@ -0,0 +1,26 @@
+import os
+import threading
+
+from cache_files import temporary_path, write_atomic, write_bytes
+
+
+def test_concurrent_writers_in_one_process_never_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / 'cache.bin')
+    assert temporary_path(path) != temporary_path(path)
+    payloads = [bytes([n]) * (1 << 20) for n in range(8)]
+    barrier = threading.Barrier(len(payloads))
+
+    def write(payload):
+        def writer(tmp_path):
+            barrier.wait()
+            write_bytes(tmp_path, payload)
+        write_atomic(path, writer)
+
+    threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path, 'rb') as f:
+        assert f.read() in payloads
+    assert os.listdir(tmp_path) == ['cache.bin']
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import trimesh
+
+import slipper_engine
+from heightfield import heightfield_solid
+
+
+def check_closed(vertices, faces):
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+    assert mesh.is_watertight
+    assert mesh.is_winding_consistent
+    return mesh
+
+
+@pytest.mark.parametrize('size', [None, 11])
+def test_heightfield_engine_outputs_one_closed_body(sole_inputs, size):
+    params = dict(sole_inputs['left'], engine='heightfield', metrics='off', size=size)
+    result = slipper_engine.generate('left', [], params)
+    assert result['bump_count'] > 0
+    mesh = check_closed(result['vertices'], result['faces'])
+    assert mesh.body_count == 1
+    assert len(result['vertex_colors']) == len(result['vertices'])
+
+
+def test_heightfield_solid_with_holes_and_corner_contacts_is_closed():
+    rng = np.random.default_rng(0)
+    xs, ys = np.linspace(0, 40, 81), np.linspace(0, 30, 61)
+    top = 5 + rng.normal(0, 0.5, (len(ys), len(xs)))
+    bottom = np.zeros_like(top)
+    top[rng.random(top.shape) < 0.05] = np.nan     # scattered holes
+    top[20:30, 20:30] = np.nan                      # a large hole
+    top[40::2, 40::2] = np.nan                      # a lattice that leaves cells meeting only at corners
+    for tolerance in (0.0, 0.5, 5.0):
+        vertices, faces, top_nodes = heightfield_solid(xs, ys, top, bottom, tolerance)
+        check_closed(vertices, faces)
+        assert np.allclose(vertices[:len(top_nodes), 2], top.ravel()[top_nodes])
+
+
+def test_simplified_heightfield_stays_within_tolerance_of_flat_surface():
+    xs, ys = np.linspace(0, 64, 129), np.linspace(0, 64, 129)
+    top = np.full((len(ys), len(xs)), 3.0)
+    vertices, faces, _ = heightfield_solid(xs, ys, top, np.zeros_like(top), tolerance=0.01)
+    check_closed(vertices, faces)
+    # A flat plate only needs full resolution along its outline
+    assert len(faces) < 0.1 * 4 * 128 * 128
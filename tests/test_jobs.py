@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from jobs import JOB_DONE, JOB_FAILED, JOB_QUEUED, JobManager, QueueFullError
+
+
+def wait_until_finished(jobs, job_id, timeout=5):
+    job = jobs.get(job_id)
+    while job['status'] not in (JOB_DONE, JOB_FAILED):
+        job = jobs.wait_for_change(job_id, job['version'], timeout)
+    return job
+
+
+def test_jobs_with_the_same_dedupe_key_share_one_job_while_it_is_active():
+    jobs = JobManager(1)
+    release = threading.Event()
+    calls = []
+
+    def work(job_id):
+        calls.append(job_id)
+        release.wait(5)
+        return {'value': 1}
+
+    first = jobs.submit(work, dedupe_key='key')
+    assert jobs.submit(work, dedupe_key='key')['id'] == first['id']
+    assert jobs.submit(work, dedupe_key='other')['id'] != first['id']
+    release.set()
+    assert wait_until_finished(jobs, first['id'])['result'] == {'value': 1}
+    again = jobs.submit(work, dedupe_key='key')
+    assert again['id'] != first['id']
+    wait_until_finished(jobs, again['id'])
+    assert calls.count(first['id']) == 1 and len(calls) == 3
+
+
+def test_submit_raises_queue_full_at_max_pending():
+    jobs = JobManager(1, max_pending=2)
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(job_id):
+        started.set()
+        release.wait(5)
+
+    running = jobs.submit(blocker)
+    assert started.wait(5)
+    queued = [jobs.submit(lambda job_id: None) for _ in range(2)]
+    assert all(job['status'] == JOB_QUEUED for job in queued)
+    with pytest.raises(QueueFullError):
+        jobs.submit(lambda job_id: None)
+    release.set()
+    for job in [running] + queued:
+        assert wait_until_finished(jobs, job['id'])['status'] == JOB_DONE
+
+
+def test_wait_for_change_returns_each_new_version_with_progress():
+    jobs = JobManager(1)
+    step = threading.Event()
+
+    def work(job_id):
+        step.wait(5)
+        jobs.update_progress(job_id, stage='bumps', bumps_placed=3)
+        raise RuntimeError('boom')
+
+    job = jobs.submit(work)
+    step.set()
+    versions, seen_progress = [], False
+    while job['status'] not in (JOB_DONE, JOB_FAILED):
+        job = jobs.wait_for_change(job['id'], job['version'], timeout=5)
+        versions.append(job['version'])
+        seen_progress = seen_progress or job['progress'].get('bumps_placed') == 3
+    assert versions == sorted(set(versions))
+    assert seen_progress and job['status'] == JOB_FAILED and job['error'] == 'boom'
+    # Progress after the job finished is ignored
+    jobs.update_progress(job['id'], stage='late')
+    assert jobs.get(job['id'])['version'] == job['version']
+    assert jobs.wait_for_change('missing', 0, timeout=0.01) is None
+
+
+def test_only_the_newest_finished_jobs_are_kept():
+    jobs = JobManager(1, max_finished=2)
+    finished = [jobs.add_finished({'n': n})['id'] for n in range(4)]
+    assert [jobs.get(job_id) is not None for job_id in finished] == [False, False, True, True]
+    assert jobs.counts()[JOB_DONE] == 2
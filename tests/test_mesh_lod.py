@@ -0,0 +1,23 @@
+import numpy as np
+import trimesh
+
+from mesh_lod import cluster_decimate, preview_cell_size
+
+
+def test_cluster_decimate_merges_cells_and_drops_collapsed_faces():
+    sphere = trimesh.creation.icosphere(subdivisions=5, radius=10)
+    cell_size = preview_cell_size(sphere.vertices, divisions=16)
+    vertices, faces = cluster_decimate(sphere.vertices, sphere.faces, cell_size)
+    assert len(vertices) < len(sphere.vertices) / 4
+    # Every vertex is referenced, and every face has three distinct vertices and occurs once
+    assert np.array_equal(np.unique(faces), np.arange(len(vertices)))
+    assert np.all((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2]))
+    assert len(np.unique(np.sort(faces, axis=1), axis=0)) == len(faces)
+    # Cluster means stay close to the surface
+    assert np.allclose(np.linalg.norm(vertices, axis=1), 10, atol=cell_size)
+
+
+def test_cluster_decimate_with_small_cells_keeps_the_mesh():
+    box = trimesh.creation.box()
+    vertices, faces = cluster_decimate(box.vertices, box.faces, 0.01)
+    assert np.allclose(vertices[faces], box.vertices[box.faces])
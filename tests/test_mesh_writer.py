@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import trimesh
+
+from mesh_writer import output_paths, write_mesh
+
+
+def random_mesh(vertex_count=500, face_count=900, seed=0):
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(-50, 50, (vertex_count, 3)).astype(np.float32)
+    faces = rng.integers(0, vertex_count, (face_count, 3)).astype(np.int32)
+    colors = rng.integers(0, 256, (vertex_count, 4)).astype(np.uint8)
+    return vertices, faces, colors
+
+
+@pytest.mark.parametrize('chunk_size', [None, 64])
+def test_ply_and_stl_round_trip_through_trimesh(tmp_path, monkeypatch, chunk_size):
+    if chunk_size:
+        monkeypatch.setattr('mesh_writer.CHUNK_SIZE', chunk_size)
+    vertices, faces, colors = random_mesh()
+    paths = write_mesh(output_paths(str(tmp_path / 'mesh.ply')), vertices, faces, colors)
+
+    ply = trimesh.load(paths['ply'], process=False)
+    assert np.array_equal(ply.vertices, vertices)
+    assert np.array_equal(ply.faces, faces)
+    assert np.array_equal(ply.visual.vertex_colors, colors)
+
+    stl = trimesh.load(paths['stl'], process=False)
+    assert np.array_equal(stl.triangles, vertices[faces])
+    expected = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+    lengths = np.linalg.norm(expected, axis=1)
+    valid = lengths > 1e-6
+    assert np.allclose(stl.face_normals[valid], expected[valid] / lengths[valid, np.newaxis], atol=1e-5)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_mesh({'obj': str(tmp_path / 'mesh.obj')}, *random_mesh())
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import metrics
+from metrics import nearest_neighbor_spacing
+
+
+def brute_force_spacing(locations):
+    distances = np.linalg.norm(locations[:, np.newaxis] - locations[np.newaxis], axis=2)
+    distances[distances == 0] = np.inf
+    nearest = distances.min(axis=1)
+    return nearest[np.isfinite(nearest)]
+
+
+@pytest.mark.parametrize('use_kdtree', [True, False])
+def test_nearest_neighbor_spacing_matches_brute_force(monkeypatch, use_kdtree):
+    if not use_kdtree:
+        monkeypatch.setattr(metrics, 'cKDTree', None)
+    elif metrics.cKDTree is None:
+        pytest.skip('scipy is not installed')
+    rng = np.random.default_rng(0)
+    clustered = rng.normal(0, 1, (200, 3))
+    scattered = rng.uniform(-100, 100, (300, 3))
+    locations = np.concatenate((clustered, scattered, clustered[:20]))  # with coincident bumps
+    assert np.allclose(nearest_neighbor_spacing(locations), brute_force_spacing(locations))
+    assert len(nearest_neighbor_spacing(np.zeros((4, 3)))) == 0
@@ -0,0 +1,24 @@
+from profiling import MetricsRegistry, Profile
+
+
+def test_registry_renders_histograms_counters_and_gauges():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    profile = Profile()
+    with profile.span('ray_cast'):
+        pass
+    profile.count('bumps', 3, zone='kidney')
+    registry.add_record(profile.record())
+    registry.inc('accufoot_jobs_total', help_text='Jobs.', outcome='failed')
+    registry.inc('accufoot_jobs_total', help_text='Jobs.', outcome='failed')
+    registry.set_counter('accufoot_result_cache_hits_total', 5, 'Result cache hits.')
+    registry.set_gauge('accufoot_result_cache_entries', 2, 'Result cache entries.')
+    lines = registry.render().splitlines()
+
+    assert '# TYPE accufoot_stage_seconds histogram' in lines
+    assert 'accufoot_stage_seconds_bucket{stage="ray_cast",le="0.1"} 1' in lines
+    assert 'accufoot_stage_seconds_count{stage="ray_cast"} 1' in lines
+    assert 'accufoot_bumps_total{zone="kidney"} 3' in lines
+    assert 'accufoot_jobs_total{outcome="failed"} 2' in lines
+    assert '# TYPE accufoot_result_cache_hits_total counter' in lines
+    assert 'accufoot_result_cache_hits_total 5' in lines
+    assert '# TYPE accufoot_result_cache_entries gauge' in lines
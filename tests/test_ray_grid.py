@@ -0,0 +1,71 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import trimesh
+
+from ray_grid import build_ray_grid, load_ray_grid, save_ray_grid, vertical_hits
+from stl_loader import load_binary_stl
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOLE_STL = os.path.join(REPO_ROOT, 'Shoe_Sole_UK_8_Left.stl')
+
+
+@pytest.fixture(scope='module')
+def sole():
+    return trimesh.load_mesh(SOLE_STL)
+
+
+def test_binary_stl_loads_like_trimesh(sole):
+    vertices, faces = load_binary_stl(SOLE_STL)
+    assert np.array_equal(vertices, sole.vertices)
+    assert np.array_equal(faces, sole.faces)
+
+
+def test_ascii_stl_is_left_to_trimesh(tmp_path):
+    path = str(tmp_path / 'box.stl')
+    trimesh.creation.box().export(path, file_type='stl_ascii')
+    assert load_binary_stl(path) is None
+
+
+@pytest.mark.parametrize('surface', ['top', 'bottom'])
+def test_vertical_hits_match_trimesh_ray_casts(sole, surface):
+    grid = build_ray_grid(sole.vertices, sole.faces)
+    rng = np.random.default_rng(0)
+    low, high = sole.bounds
+    points = rng.uniform(low[:2] - 5, high[:2] + 5, (5000, 2))
+    z = vertical_hits(grid, sole.vertices, sole.faces, points[:, 0], points[:, 1], surface)
+
+    start_z, direction = (high[2] + 10, -1.0) if surface == 'top' else (low[2] - 10, 1.0)
+    origins = np.column_stack((points, np.full(len(points), start_z)))
+    locations, index_ray, _ = sole.ray.intersects_location(
+        origins, np.tile([0.0, 0.0, direction], (len(points), 1)), multiple_hits=False)
+    expected = np.full(len(points), np.nan)
+    expected[index_ray] = locations[:, 2]
+    # Rays grazing a triangle edge may hit in one and miss in the other
+    both = ~np.isnan(z) & ~np.isnan(expected)
+    assert np.count_nonzero(np.isnan(z) != np.isnan(expected)) <= 2
+    assert both.sum() > 1000
+    assert np.allclose(z[both], expected[both], atol=1e-9)
+
+
+def test_saved_ray_grid_is_reused_until_the_stl_changes(sole, tmp_path):
+    path = str(tmp_path / 'sole.stl')
+    shutil.copyfile(SOLE_STL, path)
+    assert load_ray_grid(path) is None
+    grid = build_ray_grid(sole.vertices, sole.faces)
+    save_ray_grid(path, grid)
+    loaded = load_ray_grid(path)
+    for key in ('origin', 'cell_start', 'triangles'):
+        assert np.array_equal(loaded[key], grid[key])
+    assert loaded['shape'] == grid['shape'] and loaded['cell_size'] == grid['cell_size']
+    assert isinstance(loaded['cell_start'], np.memmap) and isinstance(loaded['triangles'], np.memmap)
+    assert 'vertices' not in loaded
+
+    save_ray_grid(path, grid, sole.vertices, sole.faces)
+    loaded = load_ray_grid(path)
+    assert np.array_equal(loaded['vertices'], sole.vertices) and np.array_equal(loaded['faces'], sole.faces)
+
+    trimesh.creation.box().export(path)
+    assert load_ray_grid(path) is None
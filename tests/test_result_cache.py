@@ -0,0 +1,55 @@
+import os
+import time
+
+from result_cache import PARTIAL_MAX_AGE_SECONDS, ResultCache
+
+KEYS = [f"{n:064x}" for n in range(4)]
+
+
+def write_outputs(directory, key, size, token='job'):
+    outputs = {}
+    for fmt in ('ply', 'stl'):
+        outputs[fmt] = os.path.join(directory, f"{key}.{token}.partial.{fmt}")
+        with open(outputs[fmt], 'wb') as f:
+            f.write(b'x' * size)
+    return outputs
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=600)
+    for key in KEYS[:3]:
+        cache.put(key, write_outputs(str(tmp_path), key, 100))
+    assert cache.get(KEYS[0]) is not None  # now the most recently used
+    cache.put(KEYS[3], write_outputs(str(tmp_path), KEYS[3], 100))
+    assert cache.get(KEYS[1]) is None
+    assert not os.path.exists(tmp_path / f"{KEYS[1]}.stl")
+    assert all(cache.get(key) is not None for key in (KEYS[0], KEYS[2], KEYS[3]))
+    assert cache.stats()['bytes'] == 600 and cache.stats()['misses'] == 1
+
+
+def test_the_entry_just_written_is_kept_even_above_the_limit(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=100)
+    cache.put(KEYS[0], write_outputs(str(tmp_path), KEYS[0], 10))
+    final_ply = cache.put(KEYS[1], write_outputs(str(tmp_path), KEYS[1], 500))
+    assert os.path.exists(final_ply) and cache.get(KEYS[1]) == final_ply
+    assert cache.get(KEYS[0]) is None
+    assert cache.stats()['entries'] == 1
+
+
+def test_startup_keeps_entries_in_mtime_order_and_sweeps_only_stale_partials(tmp_path):
+    now = time.time()
+    for age, key in ((30, KEYS[1]), (20, KEYS[0]), (10, KEYS[2])):
+        for path in write_outputs(str(tmp_path), key, 100).values():
+            os.replace(path, path.replace('.job.partial', ''))
+            os.utime(path.replace('.job.partial', ''), (now - age, now - age))
+    stale = write_outputs(str(tmp_path), KEYS[3], 10, token='dead')['ply']
+    os.utime(stale, (now - PARTIAL_MAX_AGE_SECONDS - 60,) * 2)
+    fresh = write_outputs(str(tmp_path), KEYS[3], 10, token='live')['stl']
+
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 6)
+    assert not os.path.exists(stale) and os.path.exists(fresh)
+    assert cache.stats()['entries'] == 3
+    cache.max_bytes = 600
+    cache.put(KEYS[3], write_outputs(str(tmp_path), KEYS[3], 100))
+    assert cache.get(KEYS[1]) is None  # the oldest mtime went first
+    assert cache.get(KEYS[0]) is not None and cache.get(KEYS[2]) is not None
@@ -0,0 +1,48 @@
+import math
+
+import numpy as np
+import pytest
+
+import slipper_engine
+from sole_sizes import BASE_UK_SIZE, parse_uk_size, size_scale, sized_input_path
+
+
+@pytest.mark.parametrize('value, expected', [('8', 8.0), (9.5, 9.5), ('3', 3.0), (15, 15.0)])
+def test_parse_uk_size_accepts_whole_and_half_sizes(value, expected):
+    assert parse_uk_size(value) == expected
+
+
+@pytest.mark.parametrize('value', ['99', 2.5, 9.25, 'nan', 'inf', 'eight', None])
+def test_parse_uk_size_rejects_other_values(value):
+    with pytest.raises(ValueError):
+        parse_uk_size(value)
+
+
+def test_size_scale_grades_length_faster_than_width_and_keeps_thickness():
+    assert size_scale(BASE_UK_SIZE) == (1.0, 1.0, 1.0)
+    previous = size_scale(3)
+    for size in np.arange(3.5, 15.5, 0.5):
+        scale = size_scale(size)
+        assert scale[2] == 1.0
+        assert scale[0] > previous[0] and scale[1] > previous[1]
+        assert math.isclose(scale[0] - 1, (scale[1] - 1) * 2 / 3)
+        previous = scale
+    # One UK size is one barleycorn (1/3 inch) of last length
+    assert math.isclose(size_scale(9)[1] - size_scale(8)[1], 1 / (BASE_UK_SIZE + 25))
+
+
+def test_sized_input_path_finds_only_existing_per_size_soles(tmp_path):
+    base = tmp_path / 'Shoe_Sole_UK_8_Left.stl'
+    base.write_bytes(b'')
+    assert sized_input_path(str(base), 9.5) is None
+    (tmp_path / 'Shoe_Sole_UK_9.5_Left.stl').write_bytes(b'')
+    assert sized_input_path(str(base), 9.5) == str(tmp_path / 'Shoe_Sole_UK_9.5_Left.stl')
+    assert sized_input_path(str(tmp_path / 'custom_sole.stl'), 9.5) is None
+
+
+def test_derived_sole_is_the_base_scaled_in_x_and_y(sole_inputs):
+    base = slipper_engine.get_sole(slipper_engine.resolve_params('left', sole_inputs['left']))
+    sized = slipper_engine.get_sole(slipper_engine.resolve_params('left', dict(sole_inputs['left'], size=11)))
+    assert sized['base'] is base
+    assert np.allclose(sized['mesh'].vertices, base['mesh'].vertices * np.asarray(size_scale(11)))
+    assert np.array_equal(sized['mesh'].faces, base['mesh'].faces)
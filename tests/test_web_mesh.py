@@ -0,0 +1,59 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from web_mesh import QUANTIZATION_STEPS, WEB_MESH_MAGIC, dequantize_positions, select_variant, write_web_mesh
+
+
+def decode_web_mesh(data):
+    """Read a .wmesh file following the layout documented in web_mesh."""
+    assert data[:4] == WEB_MESH_MAGIC
+    header_length, = struct.unpack_from('<I', data, 4)
+    header = json.loads(data[8:8 + header_length])
+    start = 8 + header_length
+    arrays = {}
+    for name, info in header['buffers'].items():
+        dtype = np.dtype(info['type']).newbyteorder('<')
+        array = np.frombuffer(data, dtype=dtype, count=info['count'] * info['itemSize'], offset=start + info['offset'])
+        arrays[name] = array.reshape(-1, info['itemSize']) if info['itemSize'] > 1 else array
+    return header, arrays
+
+
+@pytest.mark.parametrize('vertex_count', [300, 70000])
+def test_wmesh_and_gzip_variant_round_trip(tmp_path, vertex_count):
+    rng = np.random.default_rng(0)
+    instances = {
+        'base_vertices': rng.uniform([-80, 0, 0], [80, 260, 12], (vertex_count, 3)),
+        'base_faces': rng.integers(0, vertex_count, (2 * vertex_count, 3)),
+        'template_vertices': rng.normal(0, 2, (42, 3)),
+        'template_faces': rng.integers(0, 42, (80, 3)),
+        'centers': rng.uniform([-70, 10, 5], [70, 250, 14], (25, 3)),
+        'palette_index': rng.integers(0, 3, 25),
+        'palette': [[255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255]],
+    }
+    path = str(tmp_path / 'sole.wmesh')
+    written = write_web_mesh(path, instances, [200, 200, 200, 255])
+    with open(written['wmesh'], 'rb') as f:
+        data = f.read()
+    with open(written['wmesh.gz'], 'rb') as f:
+        assert gzip.decompress(f.read()) == data
+
+    header, arrays = decode_web_mesh(data)
+    bounds_min, bounds_max = np.array(header['bounds']['min']), np.array(header['bounds']['max'])
+    tolerance = (bounds_max - bounds_min) / QUANTIZATION_STEPS / 2 + 1e-9
+    base = dequantize_positions(arrays['base_positions'], bounds_min, bounds_max)
+    centers = dequantize_positions(arrays['instance_centers'], bounds_min, bounds_max)
+    assert np.all(np.abs(base - instances['base_vertices']) <= tolerance)
+    assert np.all(np.abs(centers - instances['centers']) <= tolerance)
+    assert np.array_equal(arrays['base_indices'].reshape(-1, 3), instances['base_faces'])
+    assert arrays['base_indices'].dtype.itemsize == (2 if vertex_count <= 0xFFFF else 4)
+    assert np.array_equal(arrays['template_indices'].reshape(-1, 3), instances['template_faces'])
+    assert np.allclose(arrays['template_positions'], instances['template_vertices'], atol=1e-6)
+    assert np.array_equal(arrays['instance_palette'], instances['palette_index'])
+    assert header['palette'] == instances['palette'] and header['sole_color'] == [200, 200, 200, 255]
+
+    assert select_variant(path, ['gzip']) == (written['wmesh.gz'], 'gzip')
+    assert select_variant(path, []) == (path, None)
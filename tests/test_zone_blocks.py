@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+
+from zone_blocks import load_zone_blocks, prune_zone_blocks, save_zone_blocks
+
+
+def save_blocks(directory, generator_version):
+    manifest = {'template_vertex_count': 0, 'zones': {}}
+    if generator_version is not None:
+        manifest['generator_version'] = generator_version
+    arrays = {name: np.zeros((0, 3), dtype=np.int32) for name in ('base_vertices', 'base_faces', 'template_faces')}
+    return save_zone_blocks(str(directory), manifest, arrays)
+
+
+def test_prune_removes_only_older_versions_of_the_foot(tmp_path):
+    current = save_blocks(tmp_path / 'left_current', 2)
+    other_params = save_blocks(tmp_path / 'left_other', 2)
+    older = save_blocks(tmp_path / 'left_older', 1)
+    unversioned = save_blocks(tmp_path / 'left_unversioned', None)
+    other_foot = save_blocks(tmp_path / 'right_older', 1)
+    prune_zone_blocks(str(tmp_path), 'left_', 2)
+    assert load_zone_blocks(current) is not None and load_zone_blocks(other_params) is not None
+    assert not os.path.exists(older) and not os.path.exists(unversioned)
+    assert os.path.exists(other_foot)
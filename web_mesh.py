@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+
+from cache_files import write_atomic, write_bytes
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; only the gzip variant is written without it
+    brotli = None
+
+WEB_MESH_FORMAT = 'wmesh'
+WEB_MESH_MAGIC = b'AFWM'
+WEB_MESH_VERSION = 1
+QUANTIZATION_STEPS = 65535
+
+# Content-Encoding -> file suffix of the precompressed variant, in order of preference
+PRECOMPRESSED_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+
+# Layout of a .wmesh file (all little-endian):
+#
+#     4 bytes   magic 'AFWM'
+#     uint32    header length in bytes
+#     header    UTF-8 JSON, space padded to a multiple of 4 bytes
+#     buffers   raw arrays, each starting on a 4-byte boundary
+#
+# The header lists every buffer as {offset, count, type, itemSize} with offsets
+# relative to the first buffer. Sole and bump-center positions are uint16
+# quantized over header['bounds']: value = min + q * (max - min) / 65535. Bumps
+# are instances of one template placed at 'instance_centers' and colored by
+# 'instance_palette', an index into header['palette'].
+
+
+def quantize_positions(points, bounds_min, bounds_max):
+    """Map points inside [bounds_min, bounds_max] onto uint16 grid coordinates."""
+    extent = np.where(bounds_max > bounds_min, bounds_max - bounds_min, 1.0)
+    scaled = (np.asarray(points, dtype=np.float64) - bounds_min) / extent * QUANTIZATION_STEPS
+    return np.clip(np.rint(scaled), 0, QUANTIZATION_STEPS).astype('<u2')
+
+
+def dequantize_positions(quantized, bounds_min, bounds_max):
+    return bounds_min + quantized.astype(np.float64) * ((bounds_max - bounds_min) / QUANTIZATION_STEPS)
+
+
+def _index_dtype(vertex_count):
+    return np.dtype('<u2') if vertex_count <= 0xFFFF else np.dtype('<u4')
+
+
+def encode_web_mesh(instances, sole_color):
+    """Pack a result's instanced geometry (see slipper_engine.generate) into .wmesh bytes."""
+    base_vertices = np.asarray(instances['base_vertices'], dtype=np.float64)
+    centers = np.asarray(instances['centers'], dtype=np.float64).reshape(-1, 3)
+    template_vertices = np.asarray(instances['template_vertices'], dtype=np.float64)
+    positions = np.concatenate((base_vertices, centers)) if len(centers) else base_vertices
+    bounds_min, bounds_max = positions.min(axis=0), positions.max(axis=0)
+    arrays = {
+        'base_positions': quantize_positions(base_vertices, bounds_min, bounds_max),
+        'base_indices': np.asarray(instances['base_faces']).astype(_index_dtype(len(base_vertices))),
+        'template_positions': template_vertices.astype('<f4'),
+        'template_indices': np.asarray(instances['template_faces']).astype(_index_dtype(len(template_vertices))),
+        'instance_centers': quantize_positions(centers, bounds_min, bounds_max),
+        'instance_palette': np.asarray(instances['palette_index']).astype('u1'),
+    }
+    buffers = {}
+    offset = 0
+    for name, array in arrays.items():
+        buffers[name] = {
+            'offset': offset,
+            'count': len(array),
+            'type': array.dtype.name,
+            'itemSize': array.shape[1] if array.ndim > 1 else 1,
+        }
+        offset += -(-array.nbytes // 4) * 4
+    header = json.dumps({
+        'version': WEB_MESH_VERSION,
+        'bounds': {'min': bounds_min.tolist(), 'max': bounds_max.tolist()},
+        'sole_color': [int(c) for c in sole_color],
+        'palette': instances['palette'],
+        'buffers': buffers,
+    }, separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+
+    parts = [WEB_MESH_MAGIC, struct.pack('<I', len(header)), header]
+    for array in arrays.values():
+        data = np.ascontiguousarray(array).tobytes()
+        parts.append(data + b'\0' * (-len(data) % 4))
+    return b''.join(parts)
+
+
+def write_web_mesh(path, instances, sole_color, precompress=True):
+    """Write a .wmesh file plus its gzip (and, with brotli installed, brotli) variants.
+
+    Returns {format: path} for every file written, e.g. {'wmesh': ..., 'wmesh.gz': ...}.
+    """
+    data = encode_web_mesh(instances, sole_color)
+    written = {}
+    variants = [('', data)]
+    if precompress:
+        variants.append(('.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, payload in variants:
+        write_atomic(path + suffix, lambda tmp_path: write_bytes(tmp_path, payload))
+        written[WEB_MESH_FORMAT + suffix] = path + suffix
+    return written
+
+
+def select_variant(path, accepted_encodings):
+    """Pick the preferred existing precompressed variant of path the client accepts.
+
+    Returns (path, content_encoding); content_encoding is None for the plain file.
+    """
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        if encoding in accepted_encodings and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from bump_spacing import enforce_min_spacing
+from cache_files import temporary_path
+from zone_raster import ownership_order, selection_ranks
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _block_path(directory, name):
+    return os.path.join(directory, f"{name}.npy")
+
+
+def save_zone_blocks(directory, manifest, arrays):
+    """Persist a set of zone blocks as .npy files plus a JSON manifest.
+
+    arrays maps file stems (e.g. 'base_vertices', 'zone_3_vertices') to arrays.
+    The set is written to a temporary directory and renamed into place, so a
+    reader never sees a partial build; a concurrent build of the same set wins
+    the rename and this one is discarded.
+    """
+    tmp_directory = temporary_path(directory)
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, array in arrays.items():
+        np.save(_block_path(tmp_directory, name), array)
+    with open(os.path.join(tmp_directory, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        if not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            raise
+    return directory
+
+
+def prune_zone_blocks(parent, prefix, generator_version):
+    """Remove saved block sets under parent named prefix* that an older generator version built.
+
+    Sets of the current version, other parameter sets included, and
+    temporary build directories are kept.
+    """
+    try:
+        names = os.listdir(parent)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.startswith(prefix) or '.' in name:
+            continue
+        try:
+            with open(os.path.join(parent, name, MANIFEST_NAME), 'r') as f:
+                version = json.load(f).get('generator_version')
+        except (OSError, ValueError):
+            continue
+        if version != generator_version:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def load_zone_blocks(directory):
+    """Memory-map a saved set of zone blocks, or return None if it is missing."""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    blocks = {'manifest': manifest, 'zones': {}}
+    for name in ('base_vertices', 'base_faces', 'template_faces'):
+        blocks[name] = np.load(_block_path(directory, name), mmap_mode='r')
+    for zone_id in manifest['zones']:
+        blocks['zones'][int(zone_id)] = {
+            field: np.load(_block_path(directory, f"zone_{zone_id}_{field}"), mmap_mode='r')
+            for field in ('vertices', 'centers', 'cells', 'priority')
+        }
+    return blocks
+
+
+def compose_zone_blocks(blocks, zone_ids, sole_color, owner_rule='smallest', min_spacing=0):
+    """Concatenate the base sole with the bump blocks of the selected zones.
+
+    Where two selected zones hold a bump on the same grid cell, owner_rule
+    (see zone_raster.OWNERSHIP_RULES) decides which one is kept; by default
+    the one with the smaller owning polygon. With min_spacing, bumps closer
+    than that to a stronger kept bump are dropped as well. Returns
+    (vertices, faces, vertex_colors, bump_counts, centers, center_ids), where
+    bump_counts maps each zone id to its kept bumps and centers/center_ids hold
+    the kept bump centers with their zone ids.
+    """
+    manifest = blocks['manifest']
+    template_vertex_count = manifest['template_vertex_count']
+    template_faces = np.asarray(blocks['template_faces'])
+    zone_ids = [zone_id for zone_id in dict.fromkeys(zone_ids) if zone_id in blocks['zones']]
+
+    keep = {zone_id: None for zone_id in zone_ids}
+    if len(zone_ids) > 1 or min_spacing > 0:
+        cells = np.concatenate([blocks['zones'][zone_id]['cells'] for zone_id in zone_ids])
+        duplicated = len(np.unique(cells)) != len(cells)
+        if duplicated or min_spacing > 0:
+            priority = np.concatenate([blocks['zones'][zone_id]['priority'] for zone_id in zone_ids])
+            ids = np.concatenate([np.full(len(blocks['zones'][zone_id]['cells']), zone_id) for zone_id in zone_ids])
+            order = ownership_order(owner_rule, ids, priority, selection_ranks(zone_ids))
+            kept = np.ones(len(cells), dtype=bool)
+            if duplicated:
+                by_cell = order[np.argsort(cells[order], kind='stable')]
+                first = np.ones(len(by_cell), dtype=bool)
+                first[1:] = cells[by_cell][1:] != cells[by_cell][:-1]
+                kept[:] = False
+                kept[by_cell[first]] = True
+            if min_spacing > 0:
+                centers = np.concatenate([blocks['zones'][zone_id]['centers'] for zone_id in zone_ids])
+                kept = enforce_min_spacing(centers, min_spacing, order[kept[order]])
+            start = 0
+            for zone_id in zone_ids:
+                count = len(blocks['zones'][zone_id]['cells'])
+                keep[zone_id] = kept[start:start + count]
+                start += count
+
+    bump_counts = {}
+    for zone_id in zone_ids:
+        mask = keep[zone_id]
+        bump_counts[zone_id] = len(blocks['zones'][zone_id]['cells']) if mask is None else int(np.count_nonzero(mask))
+    total_bumps = sum(bump_counts.values())
+
+    base_vertices, base_faces = blocks['base_vertices'], blocks['base_faces']
+    n_base_vertices, n_base_faces = len(base_vertices), len(base_faces)
+    vertices = np.empty((n_base_vertices + total_bumps * template_vertex_count, 3), dtype=base_vertices.dtype)
+    faces = np.empty((n_base_faces + total_bumps * len(template_faces), 3), dtype=np.int64)
+    vertex_colors = np.empty((len(vertices), 4), dtype=np.uint8)
+    vertices[:n_base_vertices] = base_vertices
+    faces[:n_base_faces] = base_faces
+    vertex_colors[:n_base_vertices] = sole_color
+
+    centers = np.empty((total_bumps, 3))
+    center_ids = np.empty(total_bumps, dtype=np.int64)
+
+    vertex_start = n_base_vertices
+    bump_start = 0
+    for zone_id in zone_ids:
+        count = bump_counts[zone_id]
+        if count == 0:
+            continue
+        block_vertices = blocks['zones'][zone_id]['vertices']
+        block_centers = blocks['zones'][zone_id]['centers']
+        if keep[zone_id] is not None:
+            block_vertices = block_vertices.reshape(-1, template_vertex_count, 3)[keep[zone_id]].reshape(-1, 3)
+            block_centers = block_centers[keep[zone_id]]
+        vertex_end = vertex_start + count * template_vertex_count
+        vertices[vertex_start:vertex_end] = block_vertices
+        vertex_colors[vertex_start:vertex_end] = manifest['zones'][str(zone_id)]['color']
+        centers[bump_start:bump_start + count] = block_centers
+        center_ids[bump_start:bump_start + count] = zone_id
+        vertex_start = vertex_end
+        bump_start += count
+
+    offsets = n_base_vertices + np.arange(total_bumps) * template_vertex_count
+    instance_faces = faces[n_base_faces:].reshape(total_bumps, len(template_faces), 3)
+    np.add(template_faces[np.newaxis], offsets[:, np.newaxis, np.newaxis], out=instance_faces)
+    return vertices, faces, vertex_colors, bump_counts, centers, center_ids
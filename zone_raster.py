@@ -0,0 +1,99 @@
+import numpy as np
+from matplotlib.path import Path
+
+NO_ZONE = -1
+# Which zone owns a point claimed by several: the smallest polygon, the
+# largest polygon, or the zone selected first (then the smallest polygon).
+OWNERSHIP_RULES = ('smallest', 'largest', 'selection')
+
+
+def polygon_area(seg):
+    """Return the area of a closed polygon given as an (N, 2) array."""
+    x, y = seg[:, 0], seg[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def ownership_order(owner_rule, category_ids, areas, category_order=None):
+    """Indices that sort claims (category id, polygon area) from strongest to weakest.
+
+    category_order maps category ids to their selection rank for the
+    'selection' rule. Equal claims keep their input order.
+    """
+    if owner_rule not in OWNERSHIP_RULES:
+        raise ValueError(f"Unknown ownership rule '{owner_rule}'.")
+    areas = np.asarray(areas, dtype=np.float64)
+    if owner_rule == 'largest':
+        return np.argsort(-areas, kind='stable')
+    if owner_rule == 'selection':
+        category_order = category_order or {}
+        ranks = np.array([category_order.get(category_id, len(category_order)) for category_id in category_ids])
+        return np.lexsort((areas, ranks))
+    return np.argsort(areas, kind='stable')
+
+
+def selection_ranks(category_ids):
+    """Map each category id to the position it was first selected at."""
+    return {category_id: rank for rank, category_id in enumerate(dict.fromkeys(category_ids))}
+
+
+def compile_label_raster(pack, category_ids=None, return_areas=False, owner_rule='smallest', category_order=None):
+    """Rasterize the zone polygons of an annotation pack into an image of category ids.
+
+    Pixel (row, col) holds the category id of the annotation covering its
+    center (col + 0.5, row + 0.5), or NO_ZONE. Only annotations of
+    category_ids are drawn when given. Where polygons overlap, owner_rule
+    (see OWNERSHIP_RULES) decides; by default the smaller one wins, so zones
+    nested inside larger ones keep their area. With return_areas, also
+    returns an image of the owning polygon's area (inf where no zone).
+    """
+    width, height = pack['image_size']
+    labels = np.full((height, width), NO_ZONE, dtype=np.int16)
+    areas = np.full((height, width), np.inf, dtype=np.float32)
+    polygons = []
+    offsets = pack['polygon_offsets']
+    for index, category_id in enumerate(pack['annotation_categories'].tolist()):
+        if category_ids is not None and category_id not in category_ids:
+            continue
+        seg = pack['polygon_vertices'][offsets[index]:offsets[index + 1]]
+        polygons.append((pack['areas'][index], seg, category_id))
+    # Paint the weakest claims first so the strongest end up on top.
+    order = ownership_order(owner_rule, [item[2] for item in polygons], [item[0] for item in polygons], category_order)
+    for area, seg, category_id in (polygons[i] for i in order[::-1]):
+        min_x, min_y = np.floor(np.min(seg, axis=0)).astype(int)
+        max_x, max_y = np.ceil(np.max(seg, axis=0)).astype(int)
+        min_x, min_y = max(min_x, 0), max(min_y, 0)
+        max_x, max_y = min(max_x, width), min(max_y, height)
+        if min_x >= max_x or min_y >= max_y:
+            continue
+        rows, cols = np.mgrid[min_y:max_y, min_x:max_x]
+        centers = np.column_stack((cols.ravel() + 0.5, rows.ravel() + 0.5))
+        inside = Path(seg).contains_points(centers).reshape(rows.shape)
+        labels[min_y:max_y, min_x:max_x][inside] = category_id
+        areas[min_y:max_y, min_x:max_x][inside] = area
+    if return_areas:
+        return labels, areas
+    return labels
+
+
+def grid_cells(x, y, width, step):
+    """Return a unique integer id for each sample_label_grid point, stable across selections."""
+    columns = len(np.arange(0.5, width, step))
+    col = np.rint((np.asarray(x) - 0.5) / step).astype(np.int64)
+    row = np.rint((np.asarray(y) - 0.5) / step).astype(np.int64)
+    return row * columns + col
+
+
+def sample_label_grid(labels, category_ids, step):
+    """Sample a regular grid of pixel centers and keep the points inside the given zones.
+
+    Returns (x, y, category_id) arrays in image coordinates. The grid is
+    anchored at the image origin, so a point's position does not depend on
+    which other zones are selected.
+    """
+    height, width = labels.shape
+    xs = np.arange(0.5, width, step)
+    ys = np.arange(0.5, height, step)
+    gx, gy = np.meshgrid(xs, ys, indexing='ij')
+    ids = labels[gy.astype(np.intp), gx.astype(np.intp)]
+    mask = np.isin(ids, np.asarray(list(category_ids), dtype=labels.dtype))
+    return gx[mask], gy[mask], ids[mask]